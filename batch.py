@@ -0,0 +1,38 @@
+# Description: Edge batches shared by UndirectedGraph and DirectedGraph.
+# graph.batch() hands out an EdgeBatch that records edge changes in call order; when the with block ends without
+# an exception the graph validates and applies all of them at once, otherwise they are discarded.
+
+import contextlib
+
+
+class EdgeBatch:
+    """
+    Edge changes recorded inside a `with graph.batch() as batch:` block
+    - changes lists (edge, add) in call order, edge is (u, v) or (u, v, weight)
+    """
+
+    def __init__(self):
+        self.changes = []
+
+    def add_edge(self, u, v, weight=None) -> None:
+        """
+        Record adding edge u - v (with weight, for DirectedGraph)
+        """
+        self.changes.append(((u, v) if weight is None else (u, v, weight), True))
+
+    def remove_edge(self, u, v) -> None:
+        """
+        Record removing edge u - v
+        """
+        self.changes.append(((u, v), False))
+
+
+@contextlib.contextmanager
+def edge_batch(graph):
+    """
+    Context manager behind graph.batch(): yields an EdgeBatch and applies its changes with
+    graph._apply_changes() if the block finishes without an exception
+    """
+    batch = EdgeBatch()
+    yield batch
+    graph._apply_changes(batch.changes)
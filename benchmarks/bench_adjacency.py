@@ -0,0 +1,136 @@
+# Description: Microbenchmark for UndirectedGraph adjacency operations on power-law graphs.
+# Compares the interned, dict-backed neighbour sets against plain neighbour lists (the original
+# representation) for add_edge(), add_edges(), is_valid_path(), remove_edge() and remove_vertex().
+#
+# Usage: python benchmarks/bench_adjacency.py [--vertices N] [--edges-per-vertex M] [--seed S]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ud_graph import UndirectedGraph  # noqa: E402
+
+
+class ListAdjacencyGraph:
+    """
+    The previous UndirectedGraph mutation paths, with neighbours stored in plain lists
+    (O(degree) membership and delete)
+    """
+
+    def __init__(self):
+        self.adj_list = {}
+
+    def add_vertex(self, v: str) -> None:
+        if v not in self.adj_list:
+            self.adj_list[v] = []
+
+    def add_edge(self, u: str, v: str) -> None:
+        if u == v:
+            return
+        self.add_vertex(u)
+        self.add_vertex(v)
+        if v not in self.adj_list[u]:
+            self.adj_list[u].append(v)
+            self.adj_list[v].append(u)
+
+    def add_edges(self, edges: []) -> None:
+        for u, v in edges:
+            self.add_edge(u, v)
+
+    def remove_edge(self, v: str, u: str) -> None:
+        if v in self.adj_list and u in self.adj_list and u in self.adj_list[v]:
+            self.adj_list[u].remove(v)
+            self.adj_list[v].remove(u)
+
+    def remove_vertex(self, v: str) -> None:
+        if v in self.adj_list:
+            for vertex in self.adj_list[v]:
+                self.adj_list[vertex].remove(v)
+            del self.adj_list[v]
+
+    def is_valid_path(self, path: []) -> bool:
+        for index in range(len(path) - 1):
+            if path[index] not in self.adj_list or path[index + 1] not in self.adj_list[path[index]]:
+                return False
+        return len(path) != 1 or path[0] in self.adj_list
+
+
+def power_law_edges(n: int, m: int, seed: int) -> []:
+    """
+    Return edges of a Barabasi-Albert preferential attachment graph with n vertices,
+    each new vertex attaching to m existing ones. Produces a few very high degree hubs
+    """
+    rnd = random.Random(seed)
+    targets = list(range(m))
+    repeated = []
+    edges = []
+    for v in range(m, n):
+        for t in set(targets):
+            edges.append((str(v), str(t)))
+            repeated.extend((v, t))
+        targets = [rnd.choice(repeated) for _ in range(m)]
+    return edges
+
+
+def time_operations(graph_class, edges: [], seed: int) -> {}:
+    """
+    Time each operation on a graph of the given class, return seconds per operation name
+    """
+    rnd = random.Random(seed)
+    timings = {}
+
+    start = time.perf_counter()
+    g = graph_class()
+    for u, v in edges:
+        g.add_edge(u, v)
+    timings['add_edge'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    graph_class().add_edges(edges)
+    timings['add_edges'] = time.perf_counter() - start
+
+    # edges touching the highest degree vertices are the expensive ones for lists
+    hubs = sorted(g.adj_list, key=lambda v: len(g.adj_list[v]), reverse=True)[:100]
+    sample = [(hub, v) for hub in hubs[:10] for v in list(g.adj_list[hub])]
+    rnd.shuffle(sample)
+    start = time.perf_counter()
+    for u, v in sample:
+        g.is_valid_path([u, v, u])
+    timings['is_valid_path'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for u, v in sample:
+        g.remove_edge(u, v)
+    timings['remove_edge'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for v in hubs:
+        g.remove_vertex(v)
+    timings['remove_vertex'] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UndirectedGraph adjacency microbenchmark')
+    parser.add_argument('--vertices', type=int, default=20000)
+    parser.add_argument('--edges-per-vertex', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    edges = power_law_edges(args.vertices, args.edges_per_vertex, args.seed)
+    print(f'power-law graph: {args.vertices} vertices, {len(edges)} edges')
+    baseline = time_operations(ListAdjacencyGraph, edges, args.seed)
+    current = time_operations(UndirectedGraph, edges, args.seed)
+
+    print(f'{"operation":<15}{"lists (s)":>12}{"sets (s)":>12}{"speedup":>10}')
+    for name in current:
+        speedup = baseline[name] / current[name] if current[name] else float('inf')
+        print(f'{name:<15}{baseline[name]:>12.4f}{current[name]:>12.4f}{speedup:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
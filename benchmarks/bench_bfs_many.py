@@ -0,0 +1,82 @@
+# Description: Microbenchmark for bfs_many() against one bfs() call per source.
+# Runs on a square grid (large diameter, many BFS levels) and a uniformly random graph (small diameter), for both
+# graph classes, and reports the time of bfs_many(sources) next to the time of looping bfs() over the same sources.
+#
+# Usage: python benchmarks/bench_bfs_many.py [--vertices N] [--sources S] [--seed S]
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from d_graph import DirectedGraph  # noqa: E402
+from ud_graph import UndirectedGraph  # noqa: E402
+from traversal import np  # noqa: E402
+
+
+def grid_edges(n: int, rnd: random.Random) -> []:
+    """
+    Return the edges of a square grid with about n vertices
+    """
+    side = max(math.isqrt(n), 2)
+    edges = []
+    for v in range(side * side):
+        row, column = divmod(v, side)
+        if column + 1 < side:
+            edges.append((v, v + 1))
+        if row + 1 < side:
+            edges.append((v, v + side))
+    return edges
+
+
+def random_edges(n: int, rnd: random.Random) -> []:
+    """
+    Return 2 * n uniformly random edges between n vertices, self-loops excluded
+    """
+    edges = []
+    while len(edges) < 2 * n:
+        u, v = rnd.randrange(n), rnd.randrange(n)
+        if u != v:
+            edges.append((u, v))
+    return edges
+
+
+def graphs(edges: []) -> []:
+    """
+    Return (label, graph, vertices) for an UndirectedGraph and a DirectedGraph holding both directions of edges
+    """
+    undirected = UndirectedGraph([(str(u), str(v)) for u, v in edges])
+    directed = DirectedGraph([(u, v, 1) for u, v in edges] + [(v, u, 1) for u, v in edges], storage='csr')
+    return [('UndirectedGraph', undirected, undirected.get_vertices()),
+            ('DirectedGraph[csr]', directed, directed.get_vertices())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='bfs_many() against looping bfs()')
+    parser.add_argument('--vertices', type=int, default=10000)
+    parser.add_argument('--sources', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'{args.sources} sources, {"NumPy" if np is not None else "pure Python"} bfs_many()')
+    print(f'{"graph":<8}{"class":<20}{"bfs loop (s)":>14}{"bfs_many (s)":>14}{"speedup":>10}')
+    for kind, generate in (('grid', grid_edges), ('random', random_edges)):
+        rnd = random.Random(args.seed)
+        for label, graph, vertices in graphs(generate(args.vertices, rnd)):
+            sources = rnd.sample(vertices, min(args.sources, len(vertices)))
+            start = time.perf_counter()
+            for v in sources:
+                graph.bfs(v)
+            loop = time.perf_counter() - start
+            start = time.perf_counter()
+            graph.bfs_many(sources)
+            many = time.perf_counter() - start
+            print(f'{kind:<8}{label:<20}{loop:>14.3f}{many:>14.3f}{loop / many:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+# Description: Benchmark suite for UndirectedGraph and DirectedGraph.
+# Generates synthetic graphs (random, power-law, grid, DAG) of the requested sizes, times construction, mutation
+# and query methods and, with --memory, measures their peak memory with tracemalloc. Results are written as JSON so
+# that runs on two versions of the code can be compared with --compare. Sizes above LARGE_SIZE need --large.
+#
+# Usage: python benchmarks/bench_graphs.py [--sizes 100,1000,10000] [--graphs random,power-law,grid,dag]
+#                                          [--output results.json] [--repeat R] [--seed S] [--memory] [--large]
+#        python benchmarks/bench_graphs.py --compare old.json new.json [--threshold 1.1] [--min-seconds 0.005]
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from d_graph import DirectedGraph  # noqa: E402
+from ud_graph import UndirectedGraph  # noqa: E402
+
+DEGREE = 4  # average out-degree of the random, power-law and DAG graphs
+LARGE_SIZE = 10000  # larger sizes take minutes per graph and only run with --large
+
+
+def random_pairs(n: int, rnd: random.Random) -> []:
+    """
+    Return DEGREE * n uniformly random vertex pairs (Erdos-Renyi style), self-loops excluded
+    """
+    pairs = []
+    while len(pairs) < DEGREE * n:
+        u, v = rnd.randrange(n), rnd.randrange(n)
+        if u != v:
+            pairs.append((u, v))
+    return pairs
+
+
+def power_law_pairs(n: int, rnd: random.Random) -> []:
+    """
+    Return the edges of a Barabasi-Albert preferential attachment graph, each new vertex attaching to
+    DEGREE existing ones, so a few vertices become very high degree hubs
+    """
+    m = min(DEGREE, max(n - 1, 1))
+    targets = list(range(m))
+    repeated = []
+    pairs = []
+    for v in range(m, n):
+        for t in set(targets):
+            pairs.append((v, t))
+            repeated.extend((v, t))
+        targets = [rnd.choice(repeated) for _ in range(m)]
+    return pairs
+
+
+def grid_pairs(n: int, rnd: random.Random) -> []:
+    """
+    Return the edges of a square grid with about n vertices, each vertex linked to its right and lower neighbour
+    (long paths and a large diameter, like road networks)
+    """
+    side = max(math.isqrt(n), 2)
+    pairs = []
+    for v in range(side * side):
+        row, column = divmod(v, side)
+        if column + 1 < side:
+            pairs.append((v, v + 1))
+        if row + 1 < side:
+            pairs.append((v, v + side))
+    return pairs
+
+
+def dag_pairs(n: int, rnd: random.Random) -> []:
+    """
+    Return DEGREE * n random pairs oriented from the lower to the higher vertex, an acyclic graph when directed
+    """
+    return [(min(u, v), max(u, v)) for u, v in random_pairs(n, rnd)]
+
+
+GENERATORS = {'random': random_pairs, 'power-law': power_law_pairs, 'grid': grid_pairs, 'dag': dag_pairs}
+
+
+def build(graph_class, edges: [], storage):
+    """
+    Build a graph through the constructor, which every version of the classes has
+    """
+    if storage is None or storage == 'dense':
+        return graph_class(edges)
+    return graph_class(edges, storage=storage)
+
+
+def cases(graph_class, storage, edges: [], vertices: [], ops: int, queries: int, rnd: random.Random):
+    """
+    Yield (operation, calls, setup, run) for every benchmarked method of graph_class.
+    setup() builds the input of run() and is not timed, run() makes calls calls of the method
+    """
+    directed = graph_class is DirectedGraph
+    sample_edges = rnd.sample(edges, min(ops, len(edges)))
+    sample_vertices = rnd.sample(vertices, min(max(ops // 10, 1), len(vertices)))
+    sources = rnd.sample(vertices, min(queries, len(vertices)))
+
+    def graph():
+        return build(graph_class, edges, storage)
+
+    yield 'construct', 1, lambda: edges, lambda e: build(graph_class, e, storage)
+
+    if directed:
+        yield 'add_vertex', ops, graph, lambda g: [g.add_vertex() for _ in range(ops)]
+    else:
+        yield 'add_vertex', ops, graph, lambda g: [g.add_vertex(f'new{i}') for i in range(ops)]
+
+    kept = edges[:len(edges) - len(sample_edges)]
+    added = edges[len(kept):]
+    if directed:
+        # the generators may leave the highest indices without edges, make sure every endpoint exists
+        def partial_graph():
+            g = build(graph_class, kept, storage)
+            if hasattr(g, 'add_vertices'):
+                g.add_vertices(len(vertices) - g.v_count)
+            else:
+                while g.v_count < len(vertices):
+                    g.add_vertex()
+            return g
+        yield 'add_edge', len(added), partial_graph, lambda g: [g.add_edge(*edge) for edge in added]
+    else:
+        yield 'add_edge', len(added), lambda: build(graph_class, kept, storage), \
+            lambda g: [g.add_edge(*edge) for edge in added]
+
+    yield 'remove_edge', len(sample_edges), graph, lambda g: [g.remove_edge(*edge[:2]) for edge in sample_edges]
+    if hasattr(graph_class, 'remove_vertex'):
+        yield 'remove_vertex', len(sample_vertices), graph, lambda g: [g.remove_vertex(v) for v in sample_vertices]
+
+    yield 'get_edges', 1, graph, lambda g: g.get_edges()
+    yield 'dfs', len(sources), graph, lambda g: [g.dfs(v) for v in sources]
+    yield 'bfs', len(sources), graph, lambda g: [g.bfs(v) for v in sources]
+    yield 'has_cycle', 1, graph, lambda g: g.has_cycle()
+    if directed:
+        yield 'dijkstra', len(sources), graph, lambda g: [g.dijkstra(v) for v in sources]
+    else:
+        yield 'count_connected_components', 1, graph, lambda g: g.count_connected_components()
+
+
+def measure(setup, run, repeat: int, memory: bool) -> ():
+    """
+    Return (best time of repeat runs in seconds, peak bytes allocated by one run or None).
+    Memory is measured in a separate run because tracing slows everything down
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        arg = setup()
+        tracemalloc.start()
+        try:
+            run(arg)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def metadata(args) -> {}:
+    """
+    Describe the run: interpreter, machine, code version and arguments
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'platform': platform.platform(), 'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sizes': args.sizes, 'graphs': args.graphs, 'repeat': args.repeat, 'seed': args.seed, 'ops': args.ops,
+            'queries': args.queries, 'memory': args.memory}
+
+
+def run_suite(args) -> {}:
+    """
+    Run every case and return the results document
+    """
+    results = []
+    for size in args.sizes:
+        for kind in args.graphs:
+            pairs = GENERATORS[kind](size, random.Random(args.seed))
+            rnd = random.Random(args.seed + 1)
+            v_count = max((max(pair) for pair in pairs), default=-1) + 1
+            weighted = [(u, v, rnd.randint(1, 10)) for u, v in pairs]
+            targets = [(UndirectedGraph, None, [(str(u), str(v)) for u, v in pairs],
+                        [str(v) for v in range(v_count)])]
+            if size <= args.dense_max:
+                targets.append((DirectedGraph, 'dense', weighted, list(range(v_count))))
+            targets.append((DirectedGraph, 'csr', weighted, list(range(v_count))))
+
+            for graph_class, storage, edges, vertices in targets:
+                try:
+                    build(graph_class, edges[:1], storage)
+                except TypeError:  # this version has no such storage
+                    continue
+                label = graph_class.__name__ + (f'[{storage}]' if storage else '')
+                for operation, calls, setup, run in cases(graph_class, storage, edges, vertices, args.ops,
+                                                          args.queries, random.Random(args.seed + 2)):
+                    seconds, peak = measure(setup, run, args.repeat, args.memory)
+                    results.append({'graph': kind, 'vertices': v_count, 'edges': len(edges), 'class': label,
+                                    'operation': operation, 'calls': calls, 'seconds': seconds,
+                                    'seconds_per_call': seconds / calls if calls else 0.0, 'peak_bytes': peak})
+                    print(f'{kind:<10}{v_count:>9} {label:<22}{operation:<28}{seconds:>10.4f}s'
+                          + (f'{peak / 2 ** 20:>10.2f} MiB' if peak is not None else ''), file=sys.stderr)
+    return {'meta': metadata(args), 'results': results}
+
+
+def compare(old_path, new_path, threshold: float, min_seconds: float) -> int:
+    """
+    Print the change of every result present in both files, return the number of regressions
+    (new time more than threshold times the old one; cases faster than min_seconds in both runs are timer noise)
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def key(result):
+        return result['graph'], result['vertices'], result['class'], result['operation']
+
+    before = {key(result): result for result in old['results']}
+    regressions = 0
+    print(f'{"graph":<10}{"vertices":>9} {"class":<22}{"operation":<28}{"old (s)":>10}{"new (s)":>10}{"ratio":>8}')
+    for result in new['results']:
+        previous = before.get(key(result))
+        if previous is None:
+            continue
+        ratio = result['seconds'] / previous['seconds'] if previous['seconds'] else float('inf')
+        flag = ''
+        if ratio > threshold and result['seconds'] >= min_seconds:
+            flag = '  <-- slower'
+            regressions += 1
+        graph, vertices, label, operation = key(result)
+        print(f'{graph:<10}{vertices:>9} {label:<22}{operation:<28}{previous["seconds"]:>10.4f}'
+              f'{result["seconds"]:>10.4f}{ratio:>8.2f}{flag}')
+    print(f'{regressions} regression(s) above {threshold:.2f}x')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UndirectedGraph / DirectedGraph benchmark suite')
+    parser.add_argument('--sizes', type=lambda s: [int(float(x)) for x in s.split(',')], default=[100, 1000, 10000],
+                        help='comma separated vertex counts, e.g. 100,1e4,1e6')
+    parser.add_argument('--graphs', type=lambda s: s.split(','), default=list(GENERATORS),
+                        help=f'comma separated graph kinds out of {",".join(GENERATORS)}')
+    parser.add_argument('--ops', type=int, default=1000, help='calls per mutation benchmark')
+    parser.add_argument('--queries', type=int, default=5, help='sources per traversal benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best time is kept')
+    parser.add_argument('--dense-max', type=int, default=2000, help="largest size run with storage='dense'")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', action='store_true',
+                        help='also record peak memory with tracemalloc, in one extra traced run per case')
+    parser.add_argument('--large', action='store_true', help=f'allow sizes above {LARGE_SIZE}')
+    parser.add_argument('--output', help='write the JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=1.1, help='slowdown ratio reported as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help='with --compare, never report cases faster than this as regressions')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold, args.min_seconds) else 0)
+
+    for kind in args.graphs:
+        if kind not in GENERATORS:
+            parser.error(f"unknown graph kind '{kind}'")
+    if not args.large and any(size > LARGE_SIZE for size in args.sizes):
+        parser.error(f'sizes above {LARGE_SIZE} need --large')
+    document = run_suite(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=1)
+    else:
+        json.dump(document, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,132 +2,1141 @@
 # Author: Rachel Thomas
 # Assignment:6
 # Description: Implement a directed graph with the following methods add_vertex(), add_edge()
-# remove_edge(), get_vertices(), get_edges()
-# is_valid_path(), dfs(), bfs()
-# has_cycle(), dijkstra()
+# remove_edge(), remove_vertex(), compact(), apply_batch(), batch(), get_vertices(), get_edges()
+# is_valid_path(), dfs(), bfs(), iter_dfs(), iter_bfs(), bfs_many()
+# has_cycle(), find_cycle(), topological_order(), dijkstra(), dijkstra_path(), shortest_path_tree(), shortest_path()
+# snapshot(), enable_stats(), disable_stats()
 
 import heapq
-from collections import deque
+import numbers
+import os
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, only the vectorized engines need it
+    np = None
 
-class DirectedGraph:
+import traversal
+from graph_io import read_graph, write_graph
+from batch import edge_batch
+from instrumentation import StatsMixin, instrumented
+from snapshots import SnapshotMixin, writer
+
+
+def _weights_array(weights: []):
+    """
+    Return weights as an array of int64 if they are all integers, of float64 if they are all floats,
+    otherwise as a list so that every weight keeps its own type
+    """
+    weights = list(weights)
+    if all(isinstance(weight, int) for weight in weights):
+        return array('q', weights)
+    if all(isinstance(weight, float) for weight in weights):
+        return array('d', weights)
+    return weights
+
+
+def _holds(weights, weight) -> bool:
+    """
+    Return True if weight can be stored in the weights container without changing its type
+    """
+    if isinstance(weights, list):
+        return True
+    return isinstance(weight, int if (weights.typecode if isinstance(weights, array) else weights.format) == 'q'
+                      else float)
+
+
+def _empty_weights(weights):
+    """
+    Return an empty container of the same kind as weights
+    """
+    if isinstance(weights, list):
+        return []
+    return array(weights.typecode if isinstance(weights, array) else weights.format)
+
+
+def _copy_view(view) -> array:
+    """
+    Return a writable array copy of a memoryview cast to 'q' or 'd'
+    """
+    values = array(view.format)
+    values.frombytes(view.cast('B'))
+    return values
+
+
+def _positions(values, v) -> []:
+    """
+    Return the positions of v in values (an array or memoryview of int64), in ascending order
+    """
+    if np is not None:
+        return np.flatnonzero(np.asarray(values) == v).tolist()
+    if isinstance(values, memoryview):
+        values = values.tolist()
+    positions = []
+    try:
+        i = values.index(v)
+        while True:
+            positions.append(i)
+            i = values.index(v, i + 1)
+    except ValueError:
+        return positions
+
+
+class _DenseStorage:
+    """
+    Adjacency matrix storage
+    - one row of weights per vertex, 0 means no edge
+    - rows are allocated with spare columns (capacity) that double when full,
+      so adding vertices one at a time is amortized O(V) instead of O(V^2)
+    - the ascending successor list of each row (and predecessor list of each column) is built on first use and
+      then kept up to date by set_weight(), so traversals never rescan or sort a row
+    - snapshot() shares the rows and lists, each one is copied here the first time it is modified afterwards
+    - O(V^2) memory, O(1) edge lookup
+    """
+
+    def __init__(self):
+        self.v_count = 0
+        self.e_count = 0
+        self.capacity = 0
+        self.rows = []
+        self._successors = []
+        self._predecessors = []
+        self._shared_rows = bytearray()  # 1 if row v and its successor list are shared with a snapshot
+        self._shared_columns = bytearray()  # 1 if the predecessor list of v is shared with a snapshot
+
+    def snapshot(self) -> '_DenseStorage':
+        """
+        Return a read-only copy that shares every row and cached list with this storage
+        """
+        snapshot = _DenseStorage()
+        snapshot.v_count, snapshot.e_count, snapshot.capacity = self.v_count, self.e_count, self.capacity
+        snapshot.rows = list(self.rows)
+        snapshot._successors = list(self._successors)
+        snapshot._predecessors = list(self._predecessors)
+        self._shared_rows = bytearray(b'\1') * self.v_count
+        self._shared_columns = bytearray(b'\1') * self.v_count
+        return snapshot
+
+    def _own_row(self, v: int) -> []:
+        """
+        Return row v for writing, copying it and its successor list first if a snapshot shares them
+        """
+        if v < len(self._shared_rows) and self._shared_rows[v]:
+            self.rows[v] = self.rows[v][:]
+            if self._successors[v] is not None:
+                self._successors[v] = self._successors[v][:]
+            self._shared_rows[v] = 0
+        return self.rows[v]
+
+    def add_vertices(self, n: int) -> None:
+        """
+        Add n empty rows and columns, growing the row capacity if needed
+        """
+        v_count = self.v_count + n
+        if v_count > self.capacity:
+            capacity = max(v_count, 2 * self.capacity)
+            padding = [0] * (capacity - self.capacity)
+            for v in range(len(self.rows)):
+                self._own_row(v).extend(padding)
+            self.capacity = capacity
+        self.rows.extend([0] * self.capacity for _ in range(n))
+        self._successors.extend([None] * n)
+        self._predecessors.extend([None] * n)
+        self.v_count = v_count
+
+    def load(self, v_count: int, offsets: array, columns: array, weights: array) -> None:
+        """
+        Fill an empty storage with v_count vertices and the edges given in compressed sparse row form
+        """
+        self.add_vertices(v_count)
+        for src in range(v_count):
+            row = self.rows[src]
+            for i in range(offsets[src], offsets[src + 1]):
+                row[columns[i]] = weights[i]
+        self.e_count = len(columns)
+
+    def csr_arrays(self) -> ():
+        """
+        Return (offsets, columns, weights) of the matrix in compressed sparse row form
+        """
+        offsets = array('q', [0])
+        columns = array('q')
+        weights = []
+        for src in range(self.v_count):
+            row = self.rows[src]
+            for dst in self.successors(src):
+                columns.append(dst)
+                weights.append(row[dst])
+            offsets.append(len(columns))
+        return offsets, columns, _weights_array(weights)
+
+    def weight(self, src: int, dst: int):
+        """
+        Return weight of edge src -> dst, 0 if there is no edge
+        """
+        return self.rows[src][dst]
+
+    def set_weight(self, src: int, dst: int, weight) -> None:
+        """
+        Set weight of edge src -> dst, weight 0 removes the edge
+        """
+        row = self._own_row(src)
+        successors = self._successors[src]
+        if dst < len(self._shared_columns) and self._shared_columns[dst]:
+            if self._predecessors[dst] is not None:
+                self._predecessors[dst] = self._predecessors[dst][:]
+            self._shared_columns[dst] = 0
+        predecessors = self._predecessors[dst]
+        if row[dst] == 0 and weight != 0:
+            self.e_count += 1
+            if successors is not None:
+                insort(successors, dst)
+            if predecessors is not None:
+                insort(predecessors, src)
+        elif row[dst] != 0 and weight == 0:
+            self.e_count -= 1
+            if successors is not None:
+                del successors[bisect_left(successors, dst)]
+            if predecessors is not None:
+                del predecessors[bisect_left(predecessors, src)]
+        row[dst] = weight
+
+    def successors(self, v: int) -> []:
+        """
+        Return successors of v in ascending order. The list is cached, do not modify it
+        """
+        successors = self._successors[v]
+        if successors is None:
+            successors = [index for index, weight in enumerate(self.rows[v]) if weight != 0]
+            self._successors[v] = successors
+        return successors
+
+    def out_edges(self, v: int) -> []:
+        """
+        Return (successor, weight) pairs of v in ascending successor order
+        """
+        row = self.rows[v]
+        return [(index, row[index]) for index in self.successors(v)]
+
+    def predecessors(self, v: int) -> []:
+        """
+        Return predecessors of v in ascending order. The list is cached, do not modify it
+        """
+        predecessors = self._predecessors[v]
+        if predecessors is None:
+            rows = self.rows
+            predecessors = [index for index in range(self.v_count) if rows[index][v] != 0]
+            self._predecessors[v] = predecessors
+        return predecessors
+
+    def in_edges_ready(self) -> bool:
+        """
+        Return True, the columns of the matrix are always at hand
+        """
+        return True
+
+    def in_edges(self, v: int) -> []:
+        """
+        Return (predecessor, weight) pairs of v in ascending predecessor order
+        """
+        rows = self.rows
+        return [(index, rows[index][v]) for index in self.predecessors(v)]
+
+    def clear_vertex(self, v: int) -> None:
+        """
+        Remove every edge into or out of v
+        """
+        for w in self.successors(v)[:]:
+            self.set_weight(v, w, 0)
+        for u in self.predecessors(v)[:]:
+            self.set_weight(u, v, 0)
+
+    def apply(self, changes: {}) -> None:
+        """
+        Set the weights of many edges at once from a {(src, dst): weight} dict, weight 0 removes the edge.
+        The cached lists of the rows and columns whose edges change are dropped and rebuilt on next use
+        """
+        for (src, dst), weight in changes.items():
+            row = self._own_row(src)
+            if (row[dst] == 0) != (weight == 0):
+                self.e_count += 1 if weight != 0 else -1
+                self._successors[src] = None
+                self._predecessors[dst] = None
+            row[dst] = weight
+
+    def edges(self):
+        """
+        Yield (src, dst, weight) for every edge, ordered by src then dst
+        """
+        for src in range(self.v_count):
+            row = self.rows[src]
+            for dst in self.successors(src):
+                yield src, dst, row[dst]
+
+    def matrix(self) -> []:
+        """
+        Return a V x V copy of the adjacency matrix, without the spare columns of the rows
+        """
+        return [row[:self.v_count] for row in self.rows[:self.v_count]]
+
+    def weight_array(self):
+        """
+        Return the adjacency matrix as a V x V float NumPy array
+        """
+        weights = np.zeros((self.v_count, self.v_count))
+        for v in range(self.v_count):
+            weights[v] = self.rows[v][:self.v_count]
+        return weights
+
+
+class _CSRStorage:
+    """
+    Compressed sparse row storage
+    - successors of v are columns[offsets[v]:offsets[v + 1]], kept in ascending order
+    - weights[i] is the weight of the edge stored at columns[i]
+    - the three arrays may be read-only memoryviews of a memory-mapped file (mapping, read from mapped_path),
+      they are copied into arrays on the first mutation. A mapped storage is pickled as the path of its file,
+      which is mapped again when unpickled, so worker processes share the pages instead of receiving a copy
+    - the reversed graph, used for predecessor queries, is built on first use and dropped on mutation
+      (_transpose is None, or () once in_edges_ready() has been asked since the mutation)
+    - snapshot() shares the arrays, they are copied here on the next mutation
+    - O(V + E) memory, O(log d) edge lookup. Every single-edge mutation shifts the arrays, O(V + E):
+      DirectedGraph.apply_batch() applies many changes in one O(V + E) pass
+    """
+
+    def __init__(self):
+        self.v_count = 0
+        self.offsets = array('q', [0])
+        self.columns = array('q')
+        self.weights = array('q')
+        self.mapping = None
+        self.mapped_path = None
+        self._transpose = None
+        self._shared = False  # True while a snapshot shares the arrays
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_transpose'] = None
+        if self.mapping is not None:
+            del state['offsets'], state['columns'], state['weights'], state['mapping']
+            state['mapped_e_count'] = self.e_count
+        return state
+
+    def __setstate__(self, state):
+        e_count = state.pop('mapped_e_count', None)
+        self.__dict__.update(state)
+        if e_count is not None:
+            data = read_graph(self.mapped_path, b'D', use_mmap=True)
+            if data['v_count'] != self.v_count or len(data['columns']) != e_count:
+                raise ValueError(f'{self.mapped_path} changed since it was loaded')
+            self.offsets, self.columns, self.weights = data['offsets'], data['columns'], data['weights']
+            self.mapping = data['mapping']
+
+    def snapshot(self) -> '_CSRStorage':
+        """
+        Return a read-only copy that shares the arrays (and the mapping they may live in) with this storage
+        """
+        snapshot = _CSRStorage()
+        snapshot.v_count = self.v_count
+        snapshot.offsets, snapshot.columns, snapshot.weights = self.offsets, self.columns, self.weights
+        snapshot.mapping, snapshot.mapped_path, snapshot._transpose = self.mapping, self.mapped_path, self._transpose
+        self._shared = True
+        return snapshot
+
+    def _ensure_writable(self) -> None:
+        """
+        Copy memory-mapped arrays, or arrays shared with a snapshot, into private arrays before they are modified
+        """
+        if self.mapping is not None or self._shared:
+            self.offsets, self.columns, self.weights = (_copy_view(values) if isinstance(values, memoryview)
+                                                        else values[:]
+                                                        for values in (self.offsets, self.columns, self.weights))
+            self.mapping = self.mapped_path = None
+            self._shared = False
+
+    def add_vertices(self, n: int) -> None:
+        """
+        Add n vertices with no outgoing edges
+        """
+        self._ensure_writable()
+        self.offsets.extend(array('q', [self.offsets[-1]]) * n)
+        self.v_count += n
+        self._transpose = None
+
+    def load(self, v_count: int, offsets: array, columns: array, weights) -> None:
+        """
+        Fill an empty storage with v_count vertices and the edges given in compressed sparse row form,
+        weights may be any sequence
+        """
+        if not isinstance(weights, (array, memoryview)):
+            weights = _weights_array(weights)
+        self.v_count = v_count
+        self.offsets, self.columns, self.weights = offsets, columns, weights
+        self._transpose = None
+
+    def csr_arrays(self) -> ():
+        """
+        Return (offsets, columns, weights)
+        """
+        return self.offsets, self.columns, self.weights
+
+    @property
+    def e_count(self) -> int:
+        """
+        Number of edges
+        """
+        return len(self.columns)
+
+    def _find(self, src: int, dst: int):
+        """
+        Return (position, found) of dst in the row of src
+        """
+        hi = self.offsets[src + 1]
+        i = bisect_left(self.columns, dst, self.offsets[src], hi)
+        return i, i < hi and self.columns[i] == dst
+
+    def _shift_offsets(self, src: int, delta: int) -> None:
+        """
+        Move the start of every row after src by delta
+        """
+        if np is not None:
+            np.frombuffer(self.offsets, dtype=np.int64)[src + 1:] += delta  # the view is gone before any resize
+        else:
+            self.offsets[src + 1:] = array('q', [offset + delta for offset in self.offsets[src + 1:]])
+
+    def weight(self, src: int, dst: int):
+        """
+        Return weight of edge src -> dst, 0 if there is no edge
+        """
+        i, found = self._find(src, dst)
+        return self.weights[i] if found else 0
+
+    def set_weight(self, src: int, dst: int, weight) -> None:
+        """
+        Set weight of edge src -> dst, weight 0 removes the edge
+        """
+        self._ensure_writable()
+        self._transpose = None
+        if not _holds(self.weights, weight):
+            self.weights = list(self.weights)  # mixed int and float weights
+
+        i, found = self._find(src, dst)
+        if found:
+            if weight == 0:
+                del self.columns[i]
+                del self.weights[i]
+                self._shift_offsets(src, -1)
+            else:
+                self.weights[i] = weight
+        elif weight != 0:
+            self.columns.insert(i, dst)
+            self.weights.insert(i, weight)
+            self._shift_offsets(src, 1)
+
+    def successors(self, v: int) -> []:
+        """
+        Return successors of v in ascending order (rows are stored sorted)
+        """
+        return self.columns[self.offsets[v]:self.offsets[v + 1]].tolist()
+
+    def out_edges(self, v: int) -> []:
+        """
+        Return (successor, weight) pairs of v in ascending successor order
+        """
+        lo, hi = self.offsets[v], self.offsets[v + 1]
+        return list(zip(self.columns[lo:hi], self.weights[lo:hi]))
+
+    def _reverse(self) -> ():
+        """
+        Return (offsets, columns, weights) of the reversed graph in compressed sparse row form,
+        rows sorted by predecessor. Built with a counting sort (vectorized with NumPy) and kept until the next mutation
+        """
+        if self._transpose:
+            return self._transpose
+        v_count, offsets, columns, weights = self.v_count, self.offsets, self.columns, self.weights
+        if np is not None:
+            dst = np.asarray(columns)
+            order = np.argsort(dst, kind='stable')  # stable keeps the sources of each row ascending
+            src = np.repeat(np.arange(v_count, dtype=np.int64), np.diff(np.asarray(offsets)))
+            reverse_offsets = np.zeros(v_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(dst, minlength=v_count), out=reverse_offsets[1:])
+            reverse_weights = _empty_weights(weights)
+            if isinstance(weights, list):
+                reverse_weights.extend(weights[i] for i in order.tolist())
+            else:
+                reverse_weights.frombytes(np.asarray(weights)[order].tobytes())
+            self._transpose = (array('q', reverse_offsets.tobytes()), array('q', src[order].tobytes()),
+                               reverse_weights)
+            return self._transpose
+
+        reverse_offsets = array('q', [0]) * (v_count + 1)
+        for dst in columns:
+            reverse_offsets[dst + 1] += 1
+        for v in range(v_count):
+            reverse_offsets[v + 1] += reverse_offsets[v]
+        position = reverse_offsets[:-1]
+        reverse_columns = array('q', [0]) * len(columns)
+        reverse_weights = _empty_weights(weights)
+        reverse_weights.extend([0] * len(columns))
+        for src in range(v_count):
+            for i in range(offsets[src], offsets[src + 1]):
+                dst = columns[i]
+                reverse_columns[position[dst]] = src
+                reverse_weights[position[dst]] = weights[i]
+                position[dst] += 1
+        self._transpose = (reverse_offsets, reverse_columns, reverse_weights)
+        return self._transpose
+
+    def in_edges_ready(self) -> bool:
+        """
+        Return True if in_edges() is cheap. With NumPy the reversed graph is rebuilt faster than most searches run.
+        Without it, it is only built for the second caller asking since the last mutation, so a graph that changes
+        between most queries never pays for the rebuild
+        """
+        if self._transpose is None and np is None:
+            self._transpose = ()  # asked once, mutations reset it to None
+            return False
+        return True
+
+    def predecessors(self, v: int) -> []:
+        """
+        Return predecessors of v in ascending order
+        """
+        offsets, columns, _ = self._reverse()
+        return columns[offsets[v]:offsets[v + 1]].tolist()
+
+    def in_edges(self, v: int) -> []:
+        """
+        Return (predecessor, weight) pairs of v in ascending predecessor order
+        """
+        offsets, columns, weights = self._reverse()
+        lo, hi = offsets[v], offsets[v + 1]
+        return list(zip(columns[lo:hi], weights[lo:hi]))
+
+    def clear_vertex(self, v: int) -> None:
+        """
+        Remove every edge into or out of v: one scan of columns finds the edges into v, then the arrays are
+        rebuilt in one pass
+        """
+        drop = set(_positions(self.columns, v))
+        drop.update(range(self.offsets[v], self.offsets[v + 1]))
+        if not drop:
+            return
+        drop = sorted(drop)
+        self._ensure_writable()
+        self._transpose = None
+
+        columns, weights = array('q'), _empty_weights(self.weights)
+        start = 0
+        for i in drop + [len(self.columns)]:
+            columns.extend(self.columns[start:i])
+            weights.extend(self.weights[start:i])
+            start = i + 1
+        self.offsets = array('q', (offset - bisect_left(drop, offset) for offset in self.offsets))
+        self.columns, self.weights = columns, weights
+
+    def apply(self, changes: {}) -> None:
+        """
+        Set the weights of many edges at once from a {(src, dst): weight} dict, weight 0 removes the edge.
+        The arrays are rebuilt in a single pass: unchanged rows are copied as slices, changed rows are merged
+        """
+        by_row = {}
+        for (src, dst), weight in changes.items():
+            by_row.setdefault(src, {})[dst] = weight
+        self._ensure_writable()
+        self._transpose = None
+        if not all(_holds(self.weights, weight) for weight in changes.values() if weight != 0):
+            self.weights = list(self.weights)  # mixed int and float weights
+
+        offsets, columns, weights = self.offsets, self.columns, self.weights
+        new_offsets = array('q', [0])
+        new_columns = array('q')
+        new_weights = _empty_weights(weights)
+        for src in range(self.v_count):
+            lo, hi = offsets[src], offsets[src + 1]
+            row = by_row.get(src)
+            if row is None:
+                new_columns.extend(columns[lo:hi])
+                new_weights.extend(weights[lo:hi])
+            else:
+                merged = dict(zip(columns[lo:hi], weights[lo:hi]))
+                merged.update(row)
+                for dst in sorted(merged):
+                    if merged[dst] != 0:
+                        new_columns.append(dst)
+                        new_weights.append(merged[dst])
+            new_offsets.append(len(new_columns))
+        self.offsets, self.columns, self.weights = new_offsets, new_columns, new_weights
+
+    def edges(self):
+        """
+        Yield (src, dst, weight) for every edge, ordered by src then dst
+        """
+        for src in range(self.v_count):
+            for i in range(self.offsets[src], self.offsets[src + 1]):
+                yield src, self.columns[i], self.weights[i]
+
+    def matrix(self) -> []:
+        """
+        Return the graph as a dense adjacency matrix (built on every call)
+        """
+        rows = [[0] * self.v_count for _ in range(self.v_count)]
+        for src, dst, weight in self.edges():
+            rows[src][dst] = weight
+        return rows
+
+    def weight_array(self):
+        """
+        Return the graph as a V x V float NumPy adjacency matrix
+        """
+        weights = np.zeros((self.v_count, self.v_count))
+        src = np.repeat(np.arange(self.v_count), np.diff(np.asarray(self.offsets)))
+        weights[src, np.asarray(self.columns)] = np.asarray(self.weights)
+        return weights
+
+
+_STORAGE_ENGINES = {'dense': _DenseStorage, 'csr': _CSRStorage}
+
+
+class CycleError(ValueError):
+    """
+    Raised when an operation needs an acyclic graph. cycle holds the offending vertices in path order
+    """
+
+    def __init__(self, message: str, cycle: []):
+        super().__init__(message)
+        self.cycle = cycle
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'size', 'capacity'])
+
+
+class _QueryCache:
+    """
+    Least recently used cache of query results
+    - keys are (query, args, graph version), so results computed before a mutation are never returned
+    - stale entries are not purged eagerly, they age out like any other entry
+    - a graph shares its cache with its snapshots, which query it from other threads, so access is locked
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError('cache capacity must be at least 1')
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return (True, result) if key is cached, (False, None) otherwise
+        """
+        with self._lock:
+            try:
+                result = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, result
+
+    def put(self, key, result) -> None:
+        """
+        Store result, evicting the least recently used entry when full
+        """
+        with self._lock:
+            self._entries[key] = result
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def info(self) -> CacheInfo:
+        """
+        Return the cache counters as a CacheInfo
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, len(self._entries), self.capacity)
+
+
+# all_pairs_shortest_paths() uses Floyd-Warshall at or above this edge density (E / V^2)
+_FLOYD_WARSHALL_DENSITY = 0.1
+# below this many vertices a process pool costs more than it saves
+_PARALLEL_MIN_VERTICES = 256
+
+_worker_graph = None
+
+
+def _init_worker(graph) -> None:
+    """
+    Process pool initializer, keeps the graph the worker answers queries on
+    """
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _dijkstra_rows(sources: []) -> []:
+    """
+    Process pool task, returns the dijkstra() distances of each source as an array('d')
+    """
+    return [array('d', _worker_graph._dijkstra_distances(src)) for src in sources]
+
+
+class DirectedGraph(StatsMixin, SnapshotMixin):
     """
     Class to implement directed weighted graph
     - duplicate edges not allowed
     - loops not allowed
     - only positive edge weights
     - vertex names are integers
+    - storage is either a dense adjacency matrix ('dense', default) or
+      compressed sparse rows ('csr') for large sparse graphs
+    - snapshot() returns a read-only copy that shares storage with the graph (copy-on-write),
+      mutators hold a lock so a snapshot never sees half of a write
+    - removed vertices leave a tombstone, their index is not a vertex any more but is only reused after compact()
+      renumbers the vertices. v_count counts indices, tombstones included
     """
 
-    def __init__(self, start_edges=None):
+    def __init__(self, start_edges=None, storage='dense'):
         """
-        Store graph info as adjacency matrix
-        DO NOT CHANGE THIS METHOD IN ANY WAY
+        Store graph info as adjacency matrix or compressed sparse rows
         """
+        if storage not in _STORAGE_ENGINES:
+            raise ValueError(f"unknown storage '{storage}', expected one of {sorted(_STORAGE_ENGINES)}")
         self.v_count = 0
-        self.adj_matrix = []
+        self._storage = _STORAGE_ENGINES[storage]()
+        self._version = 0
+        self._cache = None
+        self._matrix = None  # (version, rows) of the last adj_matrix built
+        self._stats = None
+        self._topo_order = None
+        self._topo_position = None
+        self._removed = bytearray()  # tombstones, 1 for removed vertices (empty while nothing was removed)
+        self._frozen = False
+        self._lock = threading.RLock()
+        self._snapshot = None  # weak reference to the latest snapshot
 
         # populate graph with initial vertices and edges (if provided)
-        # before using, implement add_vertex() and add_edge() methods
         if start_edges is not None:
-            v_count = 0
-            for u, v, _ in start_edges:
-                v_count = max(v_count, u, v)
-            for _ in range(v_count + 1):
-                self.add_vertex()
-            for u, v, weight in start_edges:
-                self.add_edge(u, v, weight)
+            self._load_edges(start_edges)
+
+    @classmethod
+    def from_edges(cls, edges, storage='dense'):
+        """
+        Build a graph from an iterable of (src, dst, weight) in a single pass, same as DirectedGraph(edges, storage).
+        Vertices 0 to the largest index are created, self-loops and negative weights are dropped and for repeated
+        edges the last weight wins (0 removes the edge)
+        """
+        graph = cls(storage=storage)
+        graph._load_edges(edges)
+        return graph
+
+    @classmethod
+    def from_arrays(cls, src, dst, weight=None, storage='dense'):
+        """
+        Build a graph from parallel sequences or NumPy arrays of sources, destinations and weights (default 1),
+        with the same rules as from_edges(). NumPy arrays are deduplicated and sorted in vectorized form
+        """
+        if np is None or not any(isinstance(a, np.ndarray) for a in (src, dst, weight)):
+            if weight is None:
+                weight = [1] * len(src)
+            return cls.from_edges(zip(src, dst, weight), storage=storage)
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        weight = np.ones(len(src), dtype=np.int64) if weight is None else np.asarray(weight)
+        v_count = int(max(src.max(initial=0), dst.max(initial=0))) + 1
+
+        keep = (src != dst) & (weight >= 0) & (src >= 0) & (dst >= 0)
+        src, dst, weight = src[keep], dst[keep], weight[keep]
+        # last occurrence of each (src, dst) wins, np.unique also sorts by src then dst
+        key = src * v_count + dst
+        _, last = np.unique(key[::-1], return_index=True)
+        last = len(key) - 1 - last
+        src, dst, weight = src[last], dst[last], weight[last]
+        keep = weight != 0
+        src, dst, weight = src[keep], dst[keep], weight[keep]
+
+        offsets = np.zeros(v_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=v_count), out=offsets[1:])
+        if np.issubdtype(weight.dtype, np.integer):
+            weights = array('q', weight.astype(np.int64).tobytes())
+        else:
+            weights = array('d', weight.astype(np.float64).tobytes())
+
+        graph = cls(storage=storage)
+        graph._load_csr(v_count, array('q', offsets.tobytes()), array('q', dst.tobytes()), weights)
+        return graph
+
+    def _load_edges(self, edges) -> None:
+        """
+        Fill an empty graph from (src, dst, weight) tuples in one pass
+        """
+        v_count = 0
+        last = {}
+        for u, v, weight in edges:
+            v_count = max(v_count, u, v)
+            if u != v and weight >= 0 and u >= 0 and v >= 0:
+                last[u, v] = weight
+        v_count += 1
+
+        # bucket by source and sort each row, cheaper than sorting all edges at once
+        rows = [[] for _ in range(v_count)]
+        for (u, v), weight in last.items():
+            if weight != 0:
+                rows[u].append((v, weight))
+        offsets = array('q', [0])
+        columns = array('q')
+        weights = []
+        for row in rows:
+            row.sort()
+            for v, weight in row:
+                columns.append(v)
+                weights.append(weight)
+            offsets.append(len(columns))
+        self._load_csr(v_count, offsets, columns, weights)
+
+    def _load_csr(self, v_count: int, offsets: array, columns: array, weights) -> None:
+        """
+        Fill an empty graph with v_count vertices and edges in compressed sparse row form
+        """
+        self._storage.load(v_count, offsets, columns, weights)
+        self.v_count = v_count
+        self._version += 1
+
+    def save(self, path) -> None:
+        """
+        Write the graph to path in the binary graph format (see graph_io), tombstones included.
+        The format holds either integer or float weights: a graph mixing both is saved with float weights
+        """
+        offsets, columns, weights = self._storage.csr_arrays()
+        if isinstance(weights, list):
+            weights = array('d', weights)
+        write_graph(path, b'D', [], offsets, columns, weights, self._removed)
+
+    @classmethod
+    def load(cls, path, mmap=False, storage='csr'):
+        """
+        Read a graph written by save(). With mmap=True (storage 'csr' only) the edge arrays are used straight from
+        the memory-mapped file: nothing is copied, pages are shared between processes that load the same file, and
+        the arrays are copied privately only if the graph is modified
+        """
+        if mmap and storage != 'csr':
+            raise ValueError("mmap=True needs storage='csr'")
+        data = read_graph(path, b'D', use_mmap=mmap)
+        graph = cls(storage=storage)
+        graph._load_csr(data['v_count'], data['offsets'], data['columns'], data['weights'])
+        graph._removed = data['removed']
+        if mmap:
+            graph._storage.mapping = data['mapping']
+            graph._storage.mapped_path = os.path.abspath(path)
+        return graph
+
+    @property
+    def adj_matrix(self) -> []:
+        """
+        V x V adjacency matrix of the graph as a list of rows. It is built on the first access after a mutation and
+        shared by later accesses, do not modify it
+        """
+        matrix = self._matrix
+        if matrix is None or matrix[0] != self._version:
+            matrix = self._matrix = (self._version, self._storage.matrix())
+        return matrix[1]
 
     def __str__(self):
         """
         Return content of the graph in human-readable form
-        DO NOT CHANGE THIS METHOD IN ANY WAY
         """
         if self.v_count == 0:
             return 'EMPTY GRAPH\n'
+        adj_matrix = self.adj_matrix
         out = '   |'
         out += ' '.join(['{:2}'.format(i) for i in range(self.v_count)]) + '\n'
         out += '-' * (self.v_count * 3 + 3) + '\n'
         for i in range(self.v_count):
-            row = self.adj_matrix[i]
+            row = adj_matrix[i]
             out += '{:2} |'.format(i)
             out += ' '.join(['{:2}'.format(w) for w in row]) + '\n'
         out = f"GRAPH ({self.v_count} vertices):\n{out}"
         return out
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['_cache'] = state['_matrix'] = None
+        return state
+
+    def _fill_snapshot(self, snapshot) -> None:
+        """
+        Snapshots share the storage, the graph copies a row (dense) or its arrays (csr) the first time it modifies
+        them afterwards
+        """
+        snapshot.v_count = self.v_count
+        snapshot._storage = self._storage.snapshot()
+        snapshot._cache = self._cache  # keys carry the version, so entries of other versions never match
+        snapshot._matrix = self._matrix
+        snapshot._topo_order = None if self._topo_order is None else list(self._topo_order)
+        snapshot._topo_position = None if self._topo_position is None else list(self._topo_position)
+        snapshot._removed = self._removed[:]
+
     # ------------------------------------------------------------------ #
 
+    def enable_cache(self, capacity=128) -> None:
+        """
+        Cache up to capacity results of dfs(), bfs() and dijkstra(). Results are keyed on the graph version, so a
+        cached result is only returned while the graph is unchanged. Re-enabling resets the cache.
+        Snapshots taken from now on read and fill the same cache
+        """
+        self._cache = _QueryCache(capacity)
+
+    def disable_cache(self) -> None:
+        """
+        Stop caching query results and drop the cache
+        """
+        self._cache = None
+
+    def cache_info(self):
+        """
+        Returns CacheInfo(hits, misses, evictions, size, capacity), None if caching is disabled
+        """
+        return None if self._cache is None else self._cache.info()
+
+    def _cached_query(self, query: str, compute, *args) -> []:
+        """
+        Return compute(*args), through the query cache when it is enabled.
+        Callers get their own copy of a cached result
+        """
+        if self._cache is None:
+            return compute(*args)
+        key = (query, tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args), self._version)
+        try:
+            found, result = self._cache.get(key)
+        except TypeError:  # unhashable arguments are not cached
+            return compute(*args)
+        if not found:
+            result = compute(*args)
+            self._cache.put(key, result)
+        return list(result)
+
+    def _has_vertex(self, v) -> bool:
+        """
+        Return True if v is a vertex index of the graph and the vertex has not been removed
+        """
+        return isinstance(v, numbers.Integral) and 0 <= v < self.v_count and not (self._removed and self._removed[v])
+
     def add_vertex(self) -> int:
         """
         Adds a new vertex to graph, returns number of vertices in graph after the addition
         """
-        self.adj_matrix.append([])
-        for list in self.adj_matrix:
-            while len(list) != len(self.adj_matrix):
-                list.append(0)
-        self.v_count = len(self.adj_matrix)
-        return len(self.adj_matrix)
+        return self.add_vertices(1)
+
+    @writer
+    def add_vertices(self, n: int) -> int:
+        """
+        Adds n new vertices to graph, returns number of vertices in graph after the addition
+        """
+        if n > 0:
+            if self._topo_order is not None:
+                self._topo_position.extend(range(len(self._topo_order), len(self._topo_order) + n))
+                self._topo_order.extend(range(self.v_count, self.v_count + n))
+            self._storage.add_vertices(n)
+            if self._removed:
+                self._removed.extend(bytes(n))
+            self.v_count = self._storage.v_count
+            self._version += 1
+        return self.v_count
 
+    @writer
     def add_edge(self, src: int, dst: int, weight=1) -> None:
         """
         Adds a new edge to the graph. If either vertices does not exist, if the weight is negative, or if src and drc
-        are the same method does nothing. If the edge already exists it will update its weight
+        are the same method does nothing. If the edge already exists it will update its weight.
+        While the topological order is maintained an edge that would close a cycle raises CycleError and the graph is
+        left unchanged
         """
         if src == dst or weight < 0:
             return None
 
-        if src > self.v_count - 1 or dst > self.v_count - 1:
+        if not self._has_vertex(src) or not self._has_vertex(dst):
             return None
 
-        if self.adj_matrix[src][dst] != 0:
-            self.adj_matrix[src][dst] = weight
-
-        else:
-            self.adj_matrix[src][dst] = weight
+        if self._topo_order is not None and weight != 0:
+            self._reorder_for_edge(src, dst)
+        self._storage.set_weight(src, dst, weight)
+        self._version += 1
 
+    @writer
     def remove_edge(self, src: int, dst: int) -> None:
         """
         Removes an edge between two vertices. If either vertices does not exist or there is no edge between them it
         does nothing
         """
+        if not self._has_vertex(src) or not self._has_vertex(dst):
+            return None
 
-        if src > self.v_count - 1 or dst > self.v_count - 1:
+        if self._storage.weight(src, dst) == 0:
             return None
-        if src < 0 or dst < 0:
+
+        self._storage.set_weight(src, dst, 0)
+        self._version += 1
+
+    @writer
+    def remove_vertex(self, v: int) -> None:
+        """
+        Removes a vertex and every edge to or from it. If the vertex does not exist it does nothing.
+        The index is left as a tombstone: it is no longer a vertex for any method, and other vertices keep their
+        indices until compact() is called
+        """
+        if not self._has_vertex(v):
             return None
 
-        if self.adj_matrix[src][dst] == 0:
+        self._storage.clear_vertex(v)
+        if not self._removed:
+            self._removed = bytearray(self.v_count)
+        self._removed[v] = 1
+        self._version += 1
+
+    @writer
+    def compact(self) -> []:
+        """
+        Renumbers the remaining vertices 0, 1, ... in their current order and rebuilds the storage without the
+        removed vertices, so memory and traversal cost follow the number of live vertices again.
+        Returns a list mapping every old index to its new index (None for removed vertices)
+        """
+        removed = self._removed
+        if not removed:
+            return list(range(self.v_count))
+
+        mapping = [None] * self.v_count
+        v_count = 0
+        for v in range(self.v_count):
+            if not removed[v]:
+                mapping[v] = v_count
+                v_count += 1
+
+        # removed vertices have no edges and the mapping keeps the vertex order, so the edges stay in place:
+        # only the rows of removed vertices go and every column is renumbered
+        offsets, columns, weights = self._storage.csr_arrays()
+        new_offsets = array('q', [0])
+        new_columns = array('q')
+        for v in range(self.v_count):
+            if mapping[v] is not None:
+                new_columns.extend([mapping[w] for w in columns[offsets[v]:offsets[v + 1]]])
+                new_offsets.append(len(new_columns))
+        weights = _copy_view(weights) if isinstance(weights, memoryview) else weights[:]
+
+        storage = type(self._storage)()
+        storage.load(v_count, new_offsets, new_columns, weights)
+        self._storage = storage
+        self.v_count = v_count
+        self._removed = bytearray()
+        if self._topo_order is not None:
+            self._topo_order = [mapping[v] for v in self._topo_order if mapping[v] is not None]
+            for index, v in enumerate(self._topo_order):
+                self._topo_position[v] = index
+            del self._topo_position[v_count:]
+        self._version += 1
+        return mapping
+
+    def apply_batch(self, adds=(), removes=()) -> None:
+        """
+        Applies many edge changes at once: removes ((src, dst) pairs) first, then adds ((src, dst) or
+        (src, dst, weight) tuples, weight 1 by default). Same as remove_edge()/add_edge() calls in that order, but
+        - every change is validated before anything is modified and the batch raises ValueError for an edge whose
+          vertices do not exist, a self-loop or a negative weight
+        - the storage is updated in one pass and derived state (topological order, cached queries) once at the end
+        - while the topological order is maintained a batch that closes a cycle raises CycleError
+        A batch that raises leaves the graph unchanged
+        """
+        self._apply_changes([(edge, False) for edge in removes] + [(edge, True) for edge in adds])
+
+    def batch(self):
+        """
+        Context manager collecting edge changes: inside `with g.batch() as batch:` call batch.add_edge(src, dst,
+        weight) and batch.remove_edge(src, dst), they are applied in call order like apply_batch() when the block
+        ends. If the block raises nothing is applied
+        """
+        return edge_batch(self)
+
+    @writer
+    def _apply_changes(self, changes: []) -> None:
+        """
+        Validate and apply (edge, add) pairs in order, see apply_batch()
+        """
+        final = {}
+        for edge, add in changes:
+            if add and len(edge) == 3:
+                src, dst, weight = edge
+            elif len(edge) == 2:
+                (src, dst), weight = edge, 1 if add else 0
+            else:
+                raise ValueError(f'bad edge {edge!r}, expected (src, dst) or (src, dst, weight)')
+            if not self._has_vertex(src) or not self._has_vertex(dst):
+                raise ValueError(f'edge {edge!r} has a vertex that is not in the graph')
+            if src == dst:
+                raise ValueError(f'edge {edge!r} is a loop')
+            if weight < 0:
+                raise ValueError(f'edge {edge!r} has a negative weight')
+            final[src, dst] = weight
+
+        storage = self._storage
+        new_edges = False
+        for edge, weight in list(final.items()):
+            current = storage.weight(*edge)
+            if current == weight:
+                del final[edge]
+            elif current == 0:
+                new_edges = True
+        if not final:
             return None
 
-        self.adj_matrix[src][dst] = 0
+        order = None
+        if self._topo_order is not None and new_edges:
+            # check the graph the batch would produce before touching the storage
+            rows = {}
+            for (src, dst), weight in final.items():
+                row = rows.setdefault(src, set(storage.successors(src)))
+                if weight != 0:
+                    row.add(dst)
+                else:
+                    row.discard(dst)
+            rows = {src: sorted(row) for src, row in rows.items()}
+
+            def successors(v):
+                return rows[v] if v in rows else storage.successors(v)
+
+            order = self._kahn_order(successors)
+            if order is None:
+                cycle = traversal.find_cycle(range(self.v_count), successors, bytearray(self.v_count))
+                raise CycleError('batch would close a cycle', cycle)
+
+        storage.apply(final)
+        if order is not None:
+            position = [0] * self.v_count
+            for index, v in enumerate(order):
+                position[v] = index
+            self._topo_order, self._topo_position = order, position
+        self._version += 1
 
     def get_vertices(self) -> []:
         """
         Returns a list of vertices
         """
-        vertex_list = []
-        for i in range(len(self.adj_matrix)):
-            vertex_list.append(i)
-        return vertex_list
+        if self._removed:
+            return [v for v in range(self.v_count) if not self._removed[v]]
+        return list(range(self.v_count))
 
     def get_edges(self) -> []:
         """
         Return list of edges in the graph (any order)
         """
-        edge_list = []
-        if len(self.adj_matrix) == 0:
-            return edge_list
-
-        x = -1
-        y = -1
-        for list in self.adj_matrix:  # for each list
-            x += 1
-            y = -1
-            for value in list:
-                y += 1
-                if value != 0:
-                    edge_list.append((x, y, value))
-        return edge_list
+        return list(self._storage.edges())
 
     def is_valid_path(self, path: []) -> bool:
         """
@@ -137,176 +1146,414 @@ class DirectedGraph:
             return True
 
         if len(path) == 1:
-            if path[0] in self.get_vertices():
-                return True
-            else:
-                return False
-
-        for index in range(len(path)):
-            if index + 1 <= len(path) - 1:
-                item = path[index]
-                next = path[index + 1]
+            return self._has_vertex(path[0])
 
-                if self.adj_matrix[item][next] == 0:
-                    return False
+        for index in range(len(path) - 1):
+            item = path[index]
+            next = path[index + 1]
+            if not self._has_vertex(item) or not self._has_vertex(next):
+                return False
+            if self._storage.weight(item, next) == 0:
+                return False
         return True
 
+    @instrumented
     def dfs(self, v_start, v_end=None) -> []:
         """
         Returns list of vertices from DFS in the order they were visited. Vertices are chosen by vertex indicies in
         ascending order
         """
-        reachable = []
-        stack = []
-        successors = []
+        return self._cached_query('dfs', self._dfs, v_start, v_end)
 
-        if v_start not in self.get_vertices():
-            return reachable
-        else:
-            stack.append(v_start)
-
-        while len(stack) > 0:
-            v = stack.pop()
-            index = -1
-            for item in self.adj_matrix[v]:
-                index += 1
-                if item != 0:
-                    successors.append(index)
-                successors = sorted(successors, reverse=True)
-
-            if v not in reachable:
-                reachable.append(v)
-                if v == v_end:
-                    return reachable
-                for item in successors:
-                    stack.append(item)
-            successors = []
+    def _dfs(self, v_start, v_end) -> []:
+        """
+        Uncached dfs(), collects iter_dfs() up to v_end
+        """
+        reachable = []
+        for v in self.iter_dfs(v_start):
+            reachable.append(v)
+            if v == v_end:
+                break
         return reachable
 
-    def bfs(self, v_start, v_end=None) -> []:
+    @instrumented
+    def bfs(self, v_start, v_end=None, max_depth=None) -> []:
         """
         Returns list of vertices from BFS in the order they were visited. Vertices are chosen by vertex indicies in
-        ascending order
+        ascending order, vertices further than max_depth edges from v_start are not visited
+        """
+        return self._cached_query('bfs', self._bfs, v_start, v_end, max_depth)
+
+    def _bfs(self, v_start, v_end, max_depth) -> []:
+        """
+        Uncached bfs(), collects iter_bfs() up to v_end
         """
         reachable = []
-        q = deque()
-        successors = []
+        for v in self.iter_bfs(v_start, max_depth):
+            reachable.append(v)
+            if v == v_end:
+                break
+        return reachable
 
-        if v_start not in self.get_vertices():
-            return reachable
+    def iter_dfs(self, v_start):
+        """
+        Yields vertices in the order dfs() visits them. The search only advances as vertices are consumed
+        """
+        if not self._has_vertex(v_start):
+            return
+        yield from traversal.iter_dfs(v_start, self._storage.successors, bytearray(self.v_count), self._probe())
+
+    def iter_bfs(self, v_start, max_depth=None, with_depth=False):
+        """
+        Yields vertices in the order bfs() visits them, or (vertex, depth) pairs with with_depth=True.
+        Stops after depth max_depth (if given). The search only advances as vertices are consumed
+        """
+        if not self._has_vertex(v_start):
+            return
+        search = traversal.iter_bfs(v_start, self._storage.successors, bytearray(self.v_count), max_depth,
+                                    self._probe())
+        if with_depth:
+            yield from search
         else:
-            q.append(v_start)
+            for v, _ in search:
+                yield v
 
-        while len(q) > 0:
-            v = q.popleft()
-            index = -1
-            for item in self.adj_matrix[v]:
-                index += 1
-                if item != 0:
-                    successors.append(index)
-                successors = sorted(successors)
-
-            if v not in reachable:
-                reachable.append(v)
-                if v == v_end:
-                    return reachable
-                for item in successors:
-                    q.append(item)
-            successors = []
-        return reachable
+    @instrumented
+    def bfs_many(self, sources) -> ():
+        """
+        Runs BFS from every vertex in sources together, expanding one shared frontier per level.
+        Returns (reachable, depth), row i belongs to sources[i]: depth[i][v] is the number of edges on a shortest
+        path from sources[i] to v, -1 if v cannot be reached (or sources[i] is not a vertex), and reachable[i][v] is
+        depth[i][v] >= 0. With NumPy these are bool and int32 arrays, otherwise lists of bytearray and array('i')
+        """
+        sources = [v if self._has_vertex(v) else None for v in sources]
+        offsets, columns, _ = self._storage.csr_arrays()
+        return traversal.bfs_many(sources, offsets, columns)
 
+    @instrumented
     def has_cycle(self):
         """
         Returns True if at least one cycle in graph. False otherwise
         """
-        flag = {}
-        stack = []
-        visited = []
-        successors = []
+        return len(self.find_cycle()) > 0
 
-        vertex_list = self.get_vertices()
-        if len(vertex_list) < 0:
-            return False
+    @instrumented
+    def find_cycle(self) -> []:
+        """
+        Returns the vertices of a cycle in path order (the last vertex has an edge back to the first), empty list if
+        the graph is acyclic
+        """
+        if self._topo_order is not None:
+            return []
+        return traversal.find_cycle(range(self.v_count), self._storage.successors, bytearray(self.v_count),
+                                    probe=self._probe())
+
+    @instrumented
+    def topological_order(self) -> []:
+        """
+        Returns the vertices ordered so that every edge goes from an earlier to a later vertex. Raises CycleError if
+        the graph has a cycle. Kahn's algorithm, ties are taken in ascending vertex order
+        """
+        if self._topo_order is not None:
+            if self._removed:
+                return [v for v in self._topo_order if not self._removed[v]]
+            return list(self._topo_order)
 
-        for v in vertex_list:
-            for vertex in self.get_vertices():
-                flag[vertex] = -1
-            stack.append(v)
+        order = self._kahn_order()
+        if order is None:
+            raise CycleError('graph has a cycle', self.find_cycle())
+        return order
 
-            while len(stack) > 0:
-                v = stack.pop()
-                flag[v] = 0
-                index = -1
-                for item in self.adj_matrix[v]:
-                    index += 1
-                    if item != 0:
-                        successors.append(index)
-                successors = sorted(successors, reverse=True)
-                if v not in visited:
-                    visited.append(v)
-                    if len(successors) > 0:
-                        for item in successors:
-                            if flag[item] == 1:
-                                flag[item] = 0
-                        for item in successors:
-                            if flag[item] == 0:
-                                return True
+    def _kahn_order(self, successors=None):
+        """
+        Return a topological order of the vertices by Kahn's algorithm, None if the graph has a cycle.
+        successors(v) overrides the successors of the storage
+        """
+        if successors is None:
+            successors = self._storage.successors
+        in_degree = [0] * self.v_count
+        for v in range(self.v_count):
+            for w in successors(v):
+                in_degree[w] += 1
+
+        probe = self._probe()
+        if probe is not None:
+            successors = probe.successors(successors)
+        vertices = self.get_vertices()
+        order = []
+        q = deque(v for v in vertices if in_degree[v] == 0)
+        while q:
+            v = q.popleft()
+            order.append(v)
+            for w in successors(v):
+                in_degree[w] -= 1
+                if in_degree[w] == 0:
+                    q.append(w)
+        return order if len(order) == len(vertices) else None
 
-                            elif flag[item] == -1:
-                                stack.append(item)
-                                flag[item] = 0
+    @writer
+    def enable_topological_order(self) -> None:
+        """
+        Keep a topological order up to date as edges are added, and refuse edges that would close a cycle.
+        Raises CycleError if the graph already has a cycle
+        """
+        if self._topo_order is None:
+            order = self.topological_order()
+            position = [0] * self.v_count
+            for index, v in enumerate(order):
+                position[v] = index
+            self._topo_order, self._topo_position = order, position
 
-                            elif flag[item] == 1:
-                                flag[item] = 0
+    @writer
+    def disable_topological_order(self) -> None:
+        """
+        Stop maintaining the topological order
+        """
+        self._topo_order = self._topo_position = None
+
+    def _reorder_for_edge(self, src: int, dst: int) -> None:
+        """
+        Update the maintained topological order for a new edge src -> dst, or raise CycleError if the edge would
+        close a cycle (Marchetti-Spaccamela, Nanni and Rohnert). Only vertices positioned between dst and src are
+        searched and moved
+        """
+        order, position = self._topo_order, self._topo_position
+        lower, upper = position[dst], position[src]
+        if lower > upper:
+            return
 
+        # vertices reachable from dst that sit at or before src in the order
+        successors = self._storage.successors
+        parent = {dst: None}
+        stack = [dst]
+        while stack:
+            v = stack.pop()
+            for w in successors(v):
+                if w == src:
+                    cycle = [v]
+                    while parent[cycle[-1]] is not None:
+                        cycle.append(parent[cycle[-1]])
+                    cycle.append(src)
+                    cycle.reverse()
+                    raise CycleError(f'edge ({src}, {dst}) would create a cycle', cycle)
+                if position[w] <= upper and w not in parent:
+                    parent[w] = v
+                    stack.append(w)
 
-                    else:
-                        flag[v] = 1
+        # reached vertices move after everything else in the region, keeping their relative order
+        region = order[lower:upper + 1]
+        region = [v for v in region if v not in parent] + [v for v in region if v in parent]
+        order[lower:upper + 1] = region
+        for index, v in enumerate(region, lower):
+            position[v] = index
 
-                successors = []
+    def _dijkstra(self, sources, dst=None):
+        """
+        Binary heap Dijkstra with lazy deletion of stale heap entries
+        - sources is a vertex or an iterable of vertices, all start at distance 0
+        - stops as soon as dst (if given) is settled
+        Returns (dist, pred, settled): tentative distances, predecessor of each vertex on its shortest path
+        (None for sources and unreached vertices) and a bitmap of vertices whose distance is final
+        """
+        if isinstance(sources, numbers.Integral):
+            sources = (sources,)
+        dist = [float('inf')] * self.v_count
+        pred = [None] * self.v_count
+        settled = bytearray(self.v_count)
+        q = []
+        for v in sources:
+            if self._has_vertex(v) and dist[v] != 0:
+                dist[v] = 0
+                q.append((0, v))
+        heapq.heapify(q)
 
-        return False
+        heappush, out_edges = heapq.heappush, self._storage.out_edges
+        probe = self._probe()
+        if probe is not None:
+            heappush, out_edges = probe.heappush, probe.successors(out_edges)
+            probe.frontier(len(q))
+        while q:
+            d, v = heapq.heappop(q)
+            if settled[v]:
+                continue
+            settled[v] = 1
+            if v == dst:
+                break
+            for w, weight in out_edges(v):
+                nd = d + weight
+                if nd < dist[w]:
+                    dist[w] = nd
+                    pred[w] = v
+                    heappush(q, (nd, w))
+        return dist, pred, settled
 
-    def dijkstra(self, src: int) -> []:
+    @instrumented
+    def dijkstra(self, src, dst=None) -> []:
         """
         Performs Dijkstra algorithm to compute the length of shortest path from given vertex to all other vertices in
         the graph . Value at index of return list corresponds to length of path to that vertex
+        - src may also be an iterable of vertices, distances are then measured from the nearest of them
+        - if dst is given the search stops once its distance is known, vertices not settled by then are reported as
+          inf
         """
-        q = []
-        visited = {}
-        d = 0
-        vertex = src
-        successors = []
-
-        heapq.heappush(q, (d, vertex))
-
-        while len(q) > 0:
-            d, vertex = heapq.heappop(q)
-            index = -1
-            if vertex not in visited.keys():
-                visited[vertex] = d
-                for item in self.adj_matrix[vertex]:  # get successors
-                    index += 1
-                    if item != 0:
-                        successors.append((item + d, index))
-                    successors = sorted(successors, reverse=True)
-                    for item in successors:
-                        heapq.heappush(q, (item))  # item plus d is weight + prev weight
-                    successors = []
-
-        solution = {}
-        for i in range(len(self.adj_matrix)):
-            solution[i] = float('inf')
-
-        result = []
-        for key in visited:
-            value = visited[key]
-            solution[key] = value
-
-        for i in range(len(self.adj_matrix)):
-            w = solution[i]
-            result.append(w)
-        return (result)
+        return self._cached_query('dijkstra', self._dijkstra_distances, src, dst)
+
+    def _dijkstra_distances(self, src, dst=None) -> []:
+        """
+        Uncached dijkstra(), distances of vertices not settled before dst are reported as inf
+        """
+        dist, _, settled = self._dijkstra(src, dst)
+        if dst is not None:
+            inf = float('inf')
+            return [d if settled[v] else inf for v, d in enumerate(dist)]
+        return dist
+
+    @instrumented
+    def dijkstra_path(self, src, dst: int) -> []:
+        """
+        Returns the vertices of a shortest path from src (a vertex or an iterable of vertices) to dst, empty list if
+        dst cannot be reached
+        """
+        if not self._has_vertex(dst):
+            return []
+        _, pred, settled = self._dijkstra(src, dst)
+        if not settled[dst]:
+            return []
+        return self._build_path(pred, dst)
+
+    @instrumented
+    def shortest_path_tree(self, src) -> ():
+        """
+        Returns (dist, pred) for src (a vertex or an iterable of vertices). pred[v] is the vertex before v on a
+        shortest path to v, None for the sources and unreachable vertices
+        """
+        dist, pred, _ = self._dijkstra(src)
+        return dist, pred
+
+    @instrumented
+    def shortest_path(self, src: int, dst: int) -> ():
+        """
+        Returns (path, length) of a shortest path from src to dst, ([], inf) if dst cannot be reached.
+        Bidirectional Dijkstra: searches forward from src and backward from dst over the reversed edges, always
+        growing the side with the nearer frontier, and stops once the two frontiers together are no shorter than
+        the best path found, so only the region around the path is explored.
+        Without NumPy the first query after a mutation of a csr graph runs Dijkstra forward from src only, the
+        reversed edges are rebuilt when a second query comes in before the next mutation
+        """
+        inf = float('inf')
+        if not self._has_vertex(src) or not self._has_vertex(dst):
+            return [], inf
+        if src == dst:
+            return [src], 0
+        if not self._storage.in_edges_ready():
+            dist, pred, settled = self._dijkstra(src, dst)
+            if not settled[dst]:
+                return [], inf
+            return self._build_path(pred, dst), dist[dst]
+
+        dist = ({src: 0}, {dst: 0})
+        pred = ({src: None}, {dst: None})
+        settled = (set(), set())
+        heaps = ([(0, src)], [(0, dst)])
+        edges = (self._storage.out_edges, self._storage.in_edges)
+        heappush = heapq.heappush
+        probe = self._probe()
+        if probe is not None:
+            edges = (probe.successors(edges[0]), probe.successors(edges[1]))
+            heappush = probe.heappush
+        best, meet = inf, None
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, v = heapq.heappop(heaps[side])
+            if v in settled[side]:
+                continue
+            settled[side].add(v)
+            near, far = dist[side], dist[1 - side]
+            for w, weight in edges[side](v):
+                nd = d + weight
+                if nd < near.get(w, inf):
+                    near[w] = nd
+                    pred[side][w] = v
+                    heappush(heaps[side], (nd, w))
+                if w in far and near[w] + far[w] < best:
+                    best, meet = near[w] + far[w], w
+
+        if meet is None:
+            return [], inf
+        path = self._build_path(pred[0], meet)
+        v = pred[1][meet]
+        while v is not None:
+            path.append(v)
+            v = pred[1][v]
+        return path, best
+
+    @instrumented
+    def all_pairs_shortest_paths(self, method=None, processes=None):
+        """
+        Returns the V x V matrix of shortest path lengths, dist[i][j] is the length of the shortest path from i to j
+        and inf if j cannot be reached from i. Removed vertices (tombstones) reach nothing and cannot be reached,
+        their whole row and column are inf, diagonal included
+        - method 'floyd-warshall' (needs NumPy) runs vectorized Floyd-Warshall over the adjacency matrix,
+          method 'dijkstra' runs dijkstra() from every vertex, spread over a pool of processes. By default
+          Floyd-Warshall is picked for dense graphs when NumPy is available
+        - processes is the pool size (default: CPU count), 1 runs every search in this process
+        The matrix is a 2-D float NumPy array, or a list of array('d') rows when NumPy is not installed
+        """
+        v_count = self.v_count
+        if method is None:
+            density = self._storage.e_count / (v_count * v_count) if v_count else 0
+            method = 'floyd-warshall' if np is not None and density >= _FLOYD_WARSHALL_DENSITY else 'dijkstra'
+
+        if method == 'floyd-warshall':
+            if np is None:
+                raise ImportError("method 'floyd-warshall' requires NumPy")
+            return self._floyd_warshall()
+        if method != 'dijkstra':
+            raise ValueError(f"unknown method '{method}', expected 'floyd-warshall' or 'dijkstra'")
+
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if processes <= 1 or v_count < _PARALLEL_MIN_VERTICES:
+            rows = [array('d', self._dijkstra_distances(src)) for src in range(v_count)]
+        else:
+            chunk = -(-v_count // (processes * 4))
+            chunks = [range(i, min(i + chunk, v_count)) for i in range(0, v_count, chunk)]
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(self,)) as pool:
+                rows = [row for rows in pool.map(_dijkstra_rows, chunks) for row in rows]
+
+        if np is None:
+            return rows
+        dist = np.empty((v_count, v_count))
+        for i, row in enumerate(rows):
+            dist[i] = np.frombuffer(row)
+        return dist
+
+    def _floyd_warshall(self):
+        """
+        Floyd-Warshall with one vectorized relaxation of the whole matrix per intermediate vertex
+        """
+        weights = self._storage.weight_array()
+        dist = np.where(weights != 0, weights, np.inf)
+        np.fill_diagonal(dist, 0)
+        if self._removed:
+            removed = np.flatnonzero(np.frombuffer(bytes(self._removed), dtype=np.uint8))
+            dist[removed, removed] = np.inf  # not vertices, so not even reachable from themselves
+        for k in range(self.v_count):
+            np.minimum(dist, dist[:, k, None] + dist[None, k, :], out=dist)
+        return dist
+
+    @staticmethod
+    def _build_path(pred: [], dst: int) -> []:
+        """
+        Follow predecessors back from dst and return the path in forward order
+        """
+        path = [dst]
+        while pred[path[-1]] is not None:
+            path.append(pred[path[-1]])
+        path.reverse()
+        return path
 
 
 if __name__ == '__main__':
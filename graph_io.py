@@ -0,0 +1,147 @@
+# Description: Binary on-disk format shared by UndirectedGraph and DirectedGraph.
+#
+# Layout (all sections start on an 8 byte boundary, arrays are in the byte order named in the header):
+#   header        64 bytes, see HEADER
+#   name_offsets  (v_count + 1) int64, vertex i's name is names[name_offsets[i]:name_offsets[i + 1]]
+#   names         utf-8 vertex names (empty for DirectedGraph, whose vertices are 0..v_count-1)
+#   offsets       (v_count + 1) int64, neighbours of vertex i are columns[offsets[i]:offsets[i + 1]]
+#   columns       e_count int64 neighbour indices
+#   weights       e_count int64 or float64 edge weights (only when the weight typecode is not 0)
+#   removed       v_count bytes, 1 for removed vertices (only when the tombstones flag is set)
+
+import mmap
+import os
+import struct
+import sys
+import uuid
+from array import array
+
+MAGIC = b'GRAPHBIN'
+VERSION = 2
+# magic, version, kind (b'U' or b'D'), weight typecode (b'q', b'd' or b'\0'), byte order (b'<' or b'>'), flags,
+# v_count, e_count, size of the names section in bytes
+HEADER = struct.Struct('<8sI3sB4xQQQ')
+HEADER_SIZE = 64
+FLAG_TOMBSTONES = 1
+
+_BYTE_ORDER = b'<' if sys.byteorder == 'little' else b'>'
+
+
+def _padding(size: int) -> bytes:
+    """
+    Return the zero bytes needed to move size up to the next multiple of 8
+    """
+    return b'\0' * (-size % 8)
+
+
+def write_graph(path, kind: bytes, names: [], offsets: array, columns: array, weights, removed=None) -> None:
+    """
+    Write a graph in the binary format
+    - kind is b'U' (UndirectedGraph) or b'D' (DirectedGraph)
+    - names are the vertex names as strings, empty for DirectedGraph
+    - offsets, columns and weights are arrays or memoryviews of int64 (weights: int64 or float64),
+      weights is None for unweighted graphs
+    - removed is a bytearray with 1 for every removed vertex (DirectedGraph tombstones), None or empty if none
+    The file is written next to path under a temporary name and then renamed onto path, so a process that has the
+    old file memory-mapped (this one included) keeps reading the old contents instead of crashing on a truncated file
+    """
+    name_offsets = array('q', [0])
+    encoded = []
+    for name in names:
+        encoded.append(name.encode('utf-8'))
+        name_offsets.append(name_offsets[-1] + len(encoded[-1]))
+    blob = b''.join(encoded)
+    typecode = b'\0'
+    if weights is not None:
+        typecode = (weights.typecode if isinstance(weights, array) else weights.format).encode()
+
+    v_count = len(offsets) - 1
+    flags = FLAG_TOMBSTONES if removed and any(removed) else 0
+    header = HEADER.pack(MAGIC, VERSION, kind + typecode + _BYTE_ORDER, flags, v_count, len(columns), len(blob))
+    directory, filename = os.path.split(os.path.abspath(path))
+    temporary = os.path.join(directory, f'.{filename}.{uuid.uuid4().hex}.tmp')
+    try:
+        with open(temporary, 'xb') as f:
+            f.write(header.ljust(HEADER_SIZE, b'\0'))
+            f.write(name_offsets.tobytes() if names else array('q', [0]) * (v_count + 1))
+            f.write(blob + _padding(len(blob)))
+            f.write(offsets.tobytes())
+            f.write(columns.tobytes())
+            if weights is not None:
+                f.write(weights.tobytes())
+            if flags & FLAG_TOMBSTONES:
+                f.write(bytes(removed[:v_count]).ljust(v_count, b'\0') + _padding(v_count))
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+
+
+def read_graph(path, kind: bytes, use_mmap=False) -> {}:
+    """
+    Read a graph written by write_graph() and check it is of the given kind.
+    Returns a dict with v_count, names (list of str, empty for DirectedGraph), offsets, columns, weights
+    (None when unweighted), removed (bytearray of tombstones, empty if none) and mapping (the mmap object or None).
+    With use_mmap the arrays are read-only memoryviews over the mapped file, otherwise they are copied into arrays
+    """
+    with open(path, 'rb') as f:
+        if use_mmap:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = f.read()
+    buffer = memoryview(data)
+
+    if len(buffer) < HEADER_SIZE:
+        raise ValueError(f'{path} is not a graph file')
+    magic, version, kind_info, flags, v_count, e_count, names_size = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a graph file')
+    if version != VERSION:
+        raise ValueError(f'{path} has format version {version}, expected {VERSION}')
+    file_kind, typecode, byte_order = kind_info[:1], kind_info[1:2].decode(), kind_info[2:]
+    if file_kind != kind:
+        raise ValueError(f'{path} holds a {"directed" if file_kind == b"D" else "undirected"} graph')
+    if typecode not in ('q', 'd', '\0'):
+        raise ValueError(f'{path} has unknown weight typecode {typecode!r}')
+    swap = byte_order != _BYTE_ORDER
+
+    expected = HEADER_SIZE + 16 * (v_count + 1) + names_size + len(_padding(names_size)) + 8 * e_count
+    if typecode != '\0':
+        expected += 8 * e_count
+    if flags & FLAG_TOMBSTONES:
+        expected += v_count + len(_padding(v_count))
+    if len(buffer) != expected:
+        raise ValueError(f'{path} is {len(buffer)} bytes long, its header describes {expected} bytes '
+                         f'(truncated or corrupt file)')
+
+    position = HEADER_SIZE
+
+    def section(typecode: str, count: int):
+        nonlocal position
+        size = count * 8
+        view = buffer[position:position + size]
+        position += size
+        if use_mmap and not swap:
+            return view.cast(typecode)
+        values = array(typecode)
+        values.frombytes(view)
+        if swap:
+            values.byteswap()
+        return values
+
+    name_offsets = section('q', v_count + 1)
+    blob = buffer[position:position + names_size]
+    names = []
+    if kind == b'U':
+        names = [str(blob[name_offsets[i]:name_offsets[i + 1]], 'utf-8') for i in range(v_count)]
+    position += names_size + len(_padding(names_size))
+    offsets = section('q', v_count + 1)
+    columns = section('q', e_count)
+    weights = section(typecode, e_count) if typecode != '\0' else None
+    removed = bytearray()
+    if flags & FLAG_TOMBSTONES:
+        removed = bytearray(buffer[position:position + v_count])
+
+    return {'v_count': v_count, 'names': names, 'offsets': offsets, 'columns': columns, 'weights': weights,
+            'removed': removed, 'mapping': data if use_mmap else None}
@@ -0,0 +1,164 @@
+# Description: Asyncio front-end for UndirectedGraph and DirectedGraph queries.
+# Queries run on graph snapshots in a bounded thread pool so they never block the event loop,
+# and identical queries that are in flight at the same time share a single computation.
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _InFlight:
+    """
+    A computation shared by every caller waiting for the same query
+    - future is the concurrent.futures.Future of the worker thread
+    """
+
+    __slots__ = ('future', 'waiters')
+
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+
+class AsyncGraphService:
+    """
+    Async facade over an UndirectedGraph or DirectedGraph
+    - every query runs on graph.snapshot() in a thread pool of at most max_workers threads,
+      so the graph can keep being updated while queries run
+    - identical in-flight queries (same method, arguments and graph version) are coalesced into one computation
+    - a caller that is cancelled or times out stops waiting without disturbing the others; a computation nobody
+      waits for any more is cancelled if it has not started yet, one that is already running is left to finish
+      and keeps serving identical queries
+    - timeout (seconds, None for no limit) applies to every query unless the query gives its own
+    """
+
+    def __init__(self, graph, max_workers=None, timeout=None):
+        self._graph = graph
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='graph-query')
+        self._timeout = timeout
+        self._in_flight = {}  # (method, args, version) -> _InFlight
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shut the thread pool down, queued queries are cancelled
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def query(self, method: str, *args, timeout=None):
+        """
+        Return graph.method(*args) computed on a snapshot of the graph taken when this call is made.
+        Raises asyncio.TimeoutError if the result takes longer than timeout seconds (default: the service timeout).
+        List results are copied for each caller, other results are shared between coalesced callers
+        """
+        snapshot = self._graph.snapshot()
+        version = snapshot.version
+        try:
+            key = (method, tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args), version)
+            hash(key)
+        except TypeError:  # unhashable arguments are never coalesced
+            key = None
+
+        entry = self._in_flight.get(key) if key is not None else None
+        if entry is None or entry.future.cancelled():
+            entry = _InFlight(self._executor.submit(self._run, snapshot, method, args))
+            if key is not None:
+                self._in_flight[key] = entry
+                entry.future.add_done_callback(functools.partial(self._forget, key, entry))
+
+        if timeout is None:
+            timeout = self._timeout
+        entry.waiters += 1
+        try:
+            # each caller waits on its own asyncio wrapper, shielded so that leaving never cancels the shared future
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(entry.future)), timeout)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0:
+                # succeeds only while the computation is still queued; a running one stays in flight until it ends
+                entry.future.cancel()
+        return list(result) if isinstance(result, list) else result
+
+    @staticmethod
+    def _run(snapshot, method: str, args: ()):
+        """
+        Run one query on a snapshot, called in a worker thread
+        """
+        return getattr(snapshot, method)(*args)
+
+    def _forget(self, key, entry: _InFlight, future) -> None:
+        """
+        Drop a finished or cancelled computation so later queries start a new one.
+        Runs in the worker thread when the computation ends, or in the event loop when it is cancelled
+        """
+        if self._in_flight.get(key) is entry:
+            del self._in_flight[key]
+
+    async def dfs(self, v_start, v_end=None, timeout=None) -> []:
+        """
+        graph.dfs(v_start, v_end) off the event loop
+        """
+        return await self.query('dfs', v_start, v_end, timeout=timeout)
+
+    async def bfs(self, v_start, v_end=None, timeout=None) -> []:
+        """
+        graph.bfs(v_start, v_end) off the event loop
+        """
+        return await self.query('bfs', v_start, v_end, timeout=timeout)
+
+    async def shortest_path(self, u, v, timeout=None) -> ():
+        """
+        graph.shortest_path(u, v) off the event loop
+        """
+        return await self.query('shortest_path', u, v, timeout=timeout)
+
+    async def dijkstra(self, src, dst=None, timeout=None) -> []:
+        """
+        graph.dijkstra(src, dst) off the event loop (DirectedGraph only)
+        """
+        return await self.query('dijkstra', src, dst, timeout=timeout)
+
+
+if __name__ == '__main__':
+    from d_graph import DirectedGraph
+
+    async def main():
+        # large enough for one dijkstra() to outlast every timeout below
+        edges = [(v, (v * 7 + k) % 100000, k + 1) for v in range(100000) for k in range(10)]
+        g = DirectedGraph(edges, storage='csr')
+        stats = g.enable_stats()
+
+        print("\nAsyncGraphService - coalescing under timeout")
+        print("--------------------------------------------")
+        async with AsyncGraphService(g, max_workers=2) as service:
+            for _ in range(3):
+                try:
+                    await service.dijkstra(0, timeout=0.01)
+                except asyncio.TimeoutError:
+                    print('timed out')
+            distances = await service.dijkstra(0)
+            print(distances[:5], 'computations:', stats['dijkstra'].calls)
+
+        print("\nAsyncGraphService - cancellation of a queued query")
+        print("--------------------------------------------------")
+        stats.reset()
+        async with AsyncGraphService(g, max_workers=1) as service:
+            running = asyncio.ensure_future(service.dijkstra(1))
+            await asyncio.sleep(0.01)
+            queued = asyncio.ensure_future(service.dijkstra(2))
+            await asyncio.sleep(0.01)
+            queued.cancel()
+            try:
+                await queued
+            except asyncio.CancelledError:
+                print('cancelled')
+            print((await running)[:5])
+            # the pool runs queries in order, a cancelled query that still ran would be counted before this one
+            print((await service.dijkstra(3))[:5], 'computations:', stats['dijkstra'].calls)
+
+    asyncio.run(main())
@@ -0,0 +1,217 @@
+# Description: Opt-in per-operation instrumentation shared by UndirectedGraph and DirectedGraph.
+# graph.enable_stats(callback) attaches a GraphStats; every instrumented query then records its call count, wall time
+# and the work it did (vertices popped, edges relaxed, heap pushes, peak frontier size).
+# Both graph classes get enable_stats() / disable_stats() from StatsMixin.
+# While stats are disabled an instrumented method costs one attribute check: the algorithms only count when they are
+# handed a Probe, and they count through wrapped heap / successor functions instead of branching in their loops.
+
+import functools
+import heapq
+import threading
+import time
+from collections import namedtuple
+
+Sample = namedtuple('Sample', 'operation seconds vertices_popped edges_relaxed heap_pushes peak_frontier')
+
+
+class OperationStats:
+    """
+    Totals for one operation
+    - calls, seconds: number of calls and their total wall time
+    - vertices_popped: vertices taken off a stack, queue or heap and expanded (stale heap entries are not counted)
+    - edges_relaxed: edges scanned out of expanded vertices
+    - heap_pushes: priority queue insertions
+    - peak_frontier: largest stack, BFS level or heap seen in any single call
+    """
+
+    __slots__ = ('calls', 'seconds', 'vertices_popped', 'edges_relaxed', 'heap_pushes', 'peak_frontier')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.vertices_popped = 0
+        self.edges_relaxed = 0
+        self.heap_pushes = 0
+        self.peak_frontier = 0
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)}' for name in self.__slots__)
+        return f'OperationStats({fields})'
+
+    def as_dict(self) -> {}:
+        """
+        Return the totals as a {field: value} dict
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Probe:
+    """
+    Counters for a single instrumented call, handed to the algorithm it runs
+    """
+
+    __slots__ = ('vertices_popped', 'edges_relaxed', 'heap_pushes', 'peak_frontier')
+
+    def __init__(self):
+        self.vertices_popped = 0
+        self.edges_relaxed = 0
+        self.heap_pushes = 0
+        self.peak_frontier = 0
+
+    def frontier(self, size: int) -> None:
+        """
+        Report the current size of the stack, queue or BFS level
+        """
+        if size > self.peak_frontier:
+            self.peak_frontier = size
+
+    def successors(self, successors, stack=None):
+        """
+        Wrap successors(v) to count the vertex as popped and its edges as relaxed.
+        If the search's stack is given, its size is reported as the frontier on every call
+        """
+        def counted(v):
+            found = successors(v)
+            self.vertices_popped += 1
+            self.edges_relaxed += len(found)
+            if stack is not None and len(stack) > self.peak_frontier:
+                self.peak_frontier = len(stack)
+            return found
+        return counted
+
+    def heappush(self, heap: [], item) -> None:
+        """
+        heapq.heappush() that counts the push and tracks the heap size
+        """
+        heapq.heappush(heap, item)
+        self.heap_pushes += 1
+        if len(heap) > self.peak_frontier:
+            self.peak_frontier = len(heap)
+
+
+class GraphStats:
+    """
+    Per-operation statistics of a graph, returned by graph.enable_stats()
+    - stats['dijkstra'] is the OperationStats of dijkstra() (all zero if it was never called)
+    - callback(sample), if given, is called after every instrumented call with a Sample of that call,
+      e.g. to feed a metrics exporter
+    - an instrumented method called from inside another one counts towards the outer call only
+    - safe to share between threads, snapshots of the graph record into the same GraphStats
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._operations = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __getitem__(self, operation: str) -> OperationStats:
+        return self._operations.get(operation) or OperationStats()
+
+    def __iter__(self):
+        return iter(list(self._operations))
+
+    def __len__(self):
+        return len(self._operations)
+
+    def __repr__(self):
+        return f'GraphStats({self.as_dict()})'
+
+    def as_dict(self) -> {}:
+        """
+        Return {operation: {field: total}} for every operation called so far
+        """
+        with self._lock:
+            return {operation: stats.as_dict() for operation, stats in self._operations.items()}
+
+    def reset(self) -> None:
+        """
+        Forget all recorded calls
+        """
+        with self._lock:
+            self._operations = {}
+
+    def probe(self):
+        """
+        Return the Probe of the instrumented call running in this thread, None outside of one
+        """
+        return getattr(self._local, 'probe', None)
+
+    def _record(self, operation: str, seconds: float, probe: Probe) -> None:
+        """
+        Add one call of operation to the totals and pass its Sample to the callback
+        """
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = self._operations[operation] = OperationStats()
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.vertices_popped += probe.vertices_popped
+            stats.edges_relaxed += probe.edges_relaxed
+            stats.heap_pushes += probe.heap_pushes
+            stats.peak_frontier = max(stats.peak_frontier, probe.peak_frontier)
+        if self.callback is not None:
+            self.callback(Sample(operation, seconds, probe.vertices_popped, probe.edges_relaxed, probe.heap_pushes,
+                                 probe.peak_frontier))
+
+
+def instrumented(method):
+    """
+    Decorator for graph queries: when self._stats is a GraphStats, time the call and record it under the method's
+    name together with the counters of its Probe
+    """
+    operation = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = self._stats
+        if stats is None:
+            return method(self, *args, **kwargs)
+        local = stats._local
+        if getattr(local, 'probe', None) is not None:  # nested call, counted by the outer one
+            return method(self, *args, **kwargs)
+        probe = local.probe = Probe()
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            local.probe = None
+            stats._record(operation, seconds, probe)
+
+    return wrapper
+
+
+class StatsMixin:
+    """
+    enable_stats() / disable_stats() for a graph class keeping its GraphStats (or None) in self._stats
+    """
+
+    def enable_stats(self, callback=None) -> GraphStats:
+        """
+        Start recording per-operation statistics (calls, wall time, vertices popped, edges relaxed, heap pushes,
+        peak frontier) of the queries and return the GraphStats they go to. callback(sample) is called after every
+        recorded call. Snapshots taken from now on record into the same GraphStats
+        """
+        self._stats = GraphStats(callback)
+        return self._stats
+
+    def disable_stats(self) -> None:
+        """
+        Stop recording statistics
+        """
+        self._stats = None
+
+    @property
+    def stats(self):
+        """
+        The GraphStats being recorded, None if statistics are disabled
+        """
+        return self._stats
+
+    def _probe(self):
+        """
+        Return the instrumentation Probe of the query running in this thread, None when not recording
+        """
+        return None if self._stats is None else self._stats.probe()
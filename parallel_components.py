@@ -0,0 +1,117 @@
+# Description: Parallel connected components for UndirectedGraph.
+# The adjacency is copied once into shared memory as compressed sparse rows, next to a shared union-find parent
+# array. Worker processes take disjoint ranges of vertices and hook the roots of the endpoints of their edges
+# together in the shared array, round after round, until a whole round makes no change.
+
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+_worker_segments = None  # (offsets, targets, parent) SharedMemory segments attached in a worker
+
+
+def _share(values: array) -> SharedMemory:
+    """
+    Return a new shared memory segment holding a copy of values
+    """
+    segment = SharedMemory(create=True, size=max(len(values) * values.itemsize, 1))
+    segment.buf[:len(values) * values.itemsize] = memoryview(values).cast('B')
+    return segment
+
+
+def _init_worker(names: ()) -> None:
+    """
+    Process pool initializer, attaches the shared segments
+    """
+    global _worker_segments
+    _worker_segments = tuple(SharedMemory(name=name) for name in names)
+
+
+def _hook_range(bounds: ()) -> bool:
+    """
+    Process pool task: for every edge v - w with lo <= v < hi, hook the larger of the two roots under the smaller
+    one in the shared parent array. Returns True if any hook was made.
+    Workers write concurrently, so a hook can be overwritten; that only leaves an edge for the next round to join.
+    Every write lowers a parent to a smaller vertex of the same component, so the root of a component ends up being
+    its smallest vertex
+    """
+    lo, hi = bounds
+    views = [segment.buf.cast('q') for segment in _worker_segments]
+    try:
+        offsets, targets, parent = views
+        changed = False
+        for v in range(lo, hi):
+            for w in targets[offsets[v]:offsets[v + 1]].tolist():
+                if w <= v:
+                    continue  # every edge is stored in both directions, take it once
+                a, b = v, w
+                while parent[a] != a:
+                    parent[a] = parent[parent[a]]
+                    a = parent[a]
+                while parent[b] != b:
+                    parent[b] = parent[parent[b]]
+                    b = parent[b]
+                if a != b:
+                    if a < b:
+                        parent[b] = a
+                    else:
+                        parent[a] = b
+                    changed = True
+        return changed
+    finally:
+        for view in views:
+            view.release()
+
+
+def _flatten_range(bounds: ()) -> None:
+    """
+    Process pool task: point every vertex of the range straight at its root
+    """
+    lo, hi = bounds
+    views = [segment.buf.cast('q') for segment in _worker_segments]
+    try:
+        parent = views[2]
+        for v in range(lo, hi):
+            root = v
+            while parent[root] != root:
+                root = parent[root]
+            parent[v] = root
+    finally:
+        for view in views:
+            view.release()
+
+
+def component_roots(offsets: array, targets: array, processes: int) -> []:
+    """
+    Return roots[v] for every vertex v of the graph with neighbours targets[offsets[v]:offsets[v + 1]] (edges stored
+    in both directions, offsets and targets are array('q')): two vertices have the same root exactly when they are
+    connected, and the root of a component is its smallest vertex. The vertices are split into ranges holding
+    about the same number of edges, handled by a pool of processes workers
+    """
+    v_count = len(offsets) - 1
+    chunks = processes * 4
+    step = -(-len(targets) // chunks) or 1
+    bounds = [0]
+    for i in range(1, chunks):
+        cut = bisect_left(offsets, i * step, bounds[-1], v_count)
+        if cut > bounds[-1]:
+            bounds.append(cut)
+    bounds.append(v_count)
+    ranges = [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if lo < hi]
+
+    segments = [_share(offsets), _share(targets), _share(array('q', range(v_count)))]
+    try:
+        with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                 initargs=(tuple(segment.name for segment in segments),)) as pool:
+            while any(list(pool.map(_hook_range, ranges))):
+                pass
+            list(pool.map(_flatten_range, ranges))
+        view = segments[2].buf.cast('q')
+        roots = view[:v_count].tolist()
+        view.release()
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+    return roots
@@ -0,0 +1,84 @@
+# Description: Copy-on-write snapshot support shared by UndirectedGraph and DirectedGraph.
+# snapshot() returns a read-only graph that shares its adjacency with the live graph. Writers copy a row or
+# neighbour set before changing one that a snapshot still shares, so readers of a snapshot never need a lock.
+# Mutators run under the graph's lock, so a snapshot is never taken halfway through a write.
+# SnapshotMixin gives both graph classes version, snapshot() and pickling; each fills in its own state.
+
+import functools
+import threading
+import weakref
+
+
+def writer(method):
+    """
+    Decorator for graph mutators: raise TypeError when called on a snapshot,
+    otherwise run the method while holding the graph's (re-entrant) lock
+    """
+
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        if self._frozen:
+            raise TypeError(f'{type(self).__name__} snapshots are read-only')
+        lock = self._lock
+        lock.acquire()  # cheaper than a with block on this hot path
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release()
+
+    return locked
+
+
+class SnapshotMixin:
+    """
+    version, snapshot() and pickling for a graph class that keeps _version, _stats, _frozen, _lock (an RLock) and
+    _snapshot (weak reference to the latest snapshot). The class fills a new snapshot with its own state in
+    _fill_snapshot()
+    """
+
+    @property
+    def version(self) -> int:
+        """
+        Mutation counter, changes whenever vertices or edges are added or removed
+        """
+        return self._version
+
+    def snapshot(self):
+        """
+        Return a read-only graph holding the graph as it is now. The snapshot shares its storage with the graph,
+        which copies a part the first time it modifies it afterwards, so taking a snapshot is O(V) and queries on it
+        need no lock while this graph keeps changing.
+        Repeated calls return the same snapshot until the graph changes, mutators raise TypeError on a snapshot
+        """
+        if self._frozen:
+            return self
+        with self._lock:
+            snapshot = self._snapshot() if self._snapshot is not None else None
+            if snapshot is not None and snapshot._version == self._version:
+                return snapshot
+            snapshot = object.__new__(type(self))
+            self._fill_snapshot(snapshot)
+            snapshot._version = self._version
+            snapshot._stats = self._stats
+            snapshot._frozen = True
+            snapshot._lock = threading.RLock()
+            snapshot._snapshot = None
+            self._snapshot = weakref.ref(snapshot)
+            return snapshot
+
+    def _fill_snapshot(self, snapshot) -> None:
+        """
+        Give snapshot (a new, empty instance) this graph's state, sharing what the graph copies on write
+        """
+        raise NotImplementedError
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock'], state['_snapshot']
+        state['_stats'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        self._snapshot = None
@@ -0,0 +1,287 @@
+# Description: Traversal core shared by UndirectedGraph and DirectedGraph.
+# Visited vertices are tracked in a set, or in a bytearray bitmap for integer vertices,
+# and the visit order is produced separately as a stream of vertices.
+# Multi-source BFS keeps one bitset of sources per vertex, a Python int or a column of a NumPy uint64 matrix.
+
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, bfs_many() then returns lists of arrays
+    np = None
+
+_REACHED = bytes([1] + [0] * 255)  # bytes.translate() table from the top byte of a depth to reachable
+_BITSET_STEP_COST = 4  # pure Python: an edge step on a bitset costs about this many edge steps of a plain BFS
+
+
+def iter_dfs(v_start, successors, visited, probe=None):
+    """
+    Yield vertices reachable from v_start in depth-first order
+    - successors(v) returns the neighbours of v in the order they should be explored
+    - visited is a set, or a bytearray indexed by vertex for integer vertices.
+      Vertices are marked as they are yielded and marked vertices are never entered
+    - probe (an instrumentation.Probe) counts the work done, if given
+    """
+    stack = [v_start]
+    push = stack.extend
+    if probe is not None:
+        successors = probe.successors(successors)
+        probe.frontier(len(stack))
+
+        def push(vertices):
+            stack.extend(vertices)
+            probe.frontier(len(stack))  # the stack is largest right after a push
+
+    if isinstance(visited, bytearray):
+        while stack:
+            v = stack.pop()
+            if visited[v]:
+                continue
+            visited[v] = 1
+            yield v
+            push([w for w in reversed(successors(v)) if not visited[w]])
+    else:
+        while stack:
+            v = stack.pop()
+            if v in visited:
+                continue
+            visited.add(v)
+            yield v
+            push([w for w in reversed(successors(v)) if w not in visited])
+
+
+def iter_bfs(v_start, successors, visited, max_depth=None, probe=None):
+    """
+    Yield (vertex, depth) for vertices reachable from v_start in breadth-first order,
+    one level at a time, stopping after depth max_depth (if given)
+    - successors(v) returns the neighbours of v in the order they should be explored
+    - visited is a set, or a bytearray indexed by vertex for integer vertices.
+      Vertices are marked when they are discovered and marked vertices are never entered
+    - probe (an instrumentation.Probe) counts the work done, if given
+    """
+    if probe is not None:
+        successors = probe.successors(successors)
+    bitmap = isinstance(visited, bytearray)
+    if bitmap:
+        if visited[v_start]:
+            return
+        visited[v_start] = 1
+    else:
+        if v_start in visited:
+            return
+        visited.add(v_start)
+
+    frontier = [v_start]
+    depth = 0
+    while frontier:
+        expand = max_depth is None or depth < max_depth
+        if probe is not None:
+            probe.frontier(len(frontier))
+        next_frontier = []
+        for v in frontier:
+            yield v, depth
+            if not expand:
+                continue
+            if bitmap:
+                for w in successors(v):
+                    if not visited[w]:
+                        visited[w] = 1
+                        next_frontier.append(w)
+            else:
+                for w in successors(v):
+                    if w not in visited:
+                        visited.add(w)
+                        next_frontier.append(w)
+        frontier = next_frontier
+        depth += 1
+
+
+def bfs_many(sources: [], offsets, targets, columns=None) -> ():
+    """
+    Breadth-first search from every vertex in sources at once, one level at a time. Each vertex carries a bitset of
+    the sources that reached it and a level pushes the bitsets of all frontier vertices along their edges together,
+    so every edge is scanned once per level instead of once per source. Without NumPy, graphs with more levels than
+    about len(sources) / 4 run one plain BFS per source instead, which is cheaper there
+    - sources are integer vertices, None for a source that should reach nothing
+    - the graph is given in compressed sparse row form: the neighbours of v are targets[offsets[v]:offsets[v + 1]]
+    - columns lists the vertices to report, in column order (default: every vertex)
+    Returns (reachable, depth): depth[i][v] is the number of edges from sources[i] to v, -1 if v is not reachable,
+    and reachable[i][v] is depth[i][v] >= 0. With NumPy these are len(sources) x V arrays (bool and int32),
+    otherwise lists of bytearray and array('i') rows
+    """
+    if np is not None:
+        depth = _bfs_many_vectorized(sources, offsets, targets, columns)
+        return depth >= 0, depth
+
+    v_count = len(offsets) - 1
+    adjacency = [targets[offsets[v]:offsets[v + 1]].tolist() for v in range(v_count)]
+    depth = [array('i', [-1]) * v_count for _ in range(len(sources))]
+    # a bitset step costs a few plain BFS steps, so the bitsets only pay off when the sources share most levels:
+    # a plain BFS from the first source tells how many levels there are
+    levels = 0
+    for i, v in enumerate(sources):
+        if v is not None:
+            levels = _bfs_depth(v, adjacency, depth[i])
+            break
+    if _BITSET_STEP_COST * levels < len(sources):
+        _bfs_many_bitsets(sources, adjacency, depth)
+    else:
+        for i, v in enumerate(sources):
+            if v is not None and depth[i][v] < 0:
+                _bfs_depth(v, adjacency, depth[i])
+
+    if columns is not None:
+        depth = [array('i', [row[v] for v in columns]) for row in depth]
+    if v_count >= 1 << 24:
+        return [bytearray(d >= 0 for d in row) for row in depth], depth
+    # below 2 ** 24 vertices the most significant byte of a depth is 0xff for -1 and 0 for every reached vertex
+    high = slice(3, None, 4) if sys.byteorder == 'little' else slice(0, None, 4)
+    return [bytearray(row.tobytes()[high].translate(_REACHED)) for row in depth], depth
+
+
+def _bfs_depth(v_start, adjacency, depth) -> int:
+    """
+    Plain BFS from v_start writing the level of every vertex it reaches into depth (an array('i') of -1),
+    returns the number of levels
+    """
+    depth[v_start] = 0
+    frontier = [v_start]
+    level = 0
+    while frontier:
+        level += 1
+        next_frontier = []
+        for v in frontier:
+            for w in adjacency[v]:
+                if depth[w] < 0:
+                    depth[w] = level
+                    next_frontier.append(w)
+        frontier = next_frontier
+    return level
+
+
+def _bfs_many_bitsets(sources: [], adjacency: [], depth: []) -> None:
+    """
+    bfs_many() with a Python int bitset per vertex, writing depth[i][v] for every source i and vertex v it reaches
+    """
+    seen = [0] * len(adjacency)  # bitsets, bit i set once sources[i] has reached the vertex
+    frontier = {}
+    for i, v in enumerate(sources):
+        if v is not None:
+            frontier[v] = frontier.get(v, 0) | 1 << i
+    for v, bits in frontier.items():
+        seen[v] = bits
+
+    level = 0
+    while frontier:
+        next_frontier = {}
+        get = next_frontier.get
+        for v, bits in frontier.items():
+            remaining = bits  # only the sources that reached v at this level
+            while remaining:
+                i = remaining.bit_length() - 1
+                depth[i][v] = level
+                remaining ^= 1 << i
+            for w in adjacency[v]:
+                seen_w = seen[w]
+                new = bits & ~seen_w
+                if new:
+                    seen[w] = seen_w | new
+                    next_frontier[w] = get(w, 0) | new
+        frontier = next_frontier
+        level += 1
+
+
+def _bfs_many_vectorized(sources: [], offsets, targets, columns):
+    """
+    bfs_many() with the bitsets held as a words x V matrix of uint64 (word k of every vertex in one row). A level
+    gathers the edges of the frontier vertices only, ORs the bits they carry together per target and keeps the bits
+    a target had not seen yet, so it costs O(frontier edges x words) instead of O(V x sources). Only those new bits
+    are written to the depth matrix. Returns the len(sources) x len(columns) depth matrix
+    """
+    size = len(sources)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    v_count = len(offsets) - 1
+    words = max(1, (size + 63) // 64)
+
+    depth = np.full((size, v_count), -1, dtype=np.int32)
+    seen = np.zeros((words, v_count), dtype=np.uint64)  # bit i % 64 of seen[i // 64, v]: source i has reached v
+    index = np.array([i for i, v in enumerate(sources) if v is not None], dtype=np.int64)
+    start = np.array([v for v in sources if v is not None], dtype=np.int64)
+    np.bitwise_or.at(seen, (index // 64, start), np.left_shift(np.uint64(1), (index % 64).astype(np.uint64)))
+    depth[index, start] = 0
+    active = np.unique(start)  # the frontier, bits holds the sources that reached each of its vertices last level
+    bits = seen[:, active]
+
+    level = 0
+    while len(active):
+        level += 1
+        # every edge leaving the frontier, as the frontier column it starts from and its target
+        degree = offsets[active + 1] - offsets[active]
+        total = int(degree.sum())
+        if total == 0:
+            break
+        column = np.repeat(np.arange(len(active)), degree)
+        dst = targets[np.arange(total) + np.repeat(offsets[active] - (np.cumsum(degree) - degree), degree)]
+        order = np.argsort(dst, kind='stable')
+        dst, column = dst[order], column[order]
+        first = np.flatnonzero(np.concatenate(([True], dst[1:] != dst[:-1])))
+        hit = dst[first]
+
+        reached = np.empty((words, len(hit)), dtype=np.uint64)
+        for word in range(words):
+            np.bitwise_or.reduceat(bits[word, column], first, out=reached[word])
+        new = reached & ~seen[:, hit]
+        seen[:, hit] |= new
+        keep = new.any(axis=0)
+        active, bits = hit[keep], new[:, keep]
+
+        # each (source, vertex) pair is new at exactly one level: take the set bits out of the nonzero words,
+        # lowest first, instead of unpacking the whole frontier
+        word, column = np.nonzero(bits)
+        values = bits[word, column]
+        while len(values):
+            lowest = values & (~values + np.uint64(1))
+            depth[word * 64 + np.log2(lowest).astype(np.int64), active[column]] = level
+            values ^= lowest
+            keep = values != 0
+            word, column, values = word[keep], column[keep], values[keep]
+
+    return depth if columns is None else depth[:, columns]
+
+
+def find_cycle(roots, successors, colour, undirected=False, probe=None) -> []:
+    """
+    Return the vertices of a cycle in path order, empty list if there is none.
+    Iterative white/grey/black DFS, O(V + E)
+    - roots are the vertices to start searching from, in order
+    - colour is a bytearray indexed by vertex for integer vertices or a collections.defaultdict(int),
+      all vertices start white (0)
+    - undirected graphs do not count the edge back to the DFS parent as a cycle
+    - probe (an instrumentation.Probe) counts the work done, if given
+    """
+    grey, black = 1, 2
+    expand = successors
+    for root in roots:
+        if colour[root]:
+            continue
+        colour[root] = grey
+        path = [root]
+        if probe is not None:
+            successors = probe.successors(expand, path)
+        stack = [iter(successors(root))]
+        while stack:
+            parent = path[-2] if undirected and len(path) > 1 else None
+            for w in stack[-1]:
+                if colour[w] == grey and w != parent:
+                    return path[path.index(w):]
+                if colour[w] == 0:
+                    colour[w] = grey
+                    path.append(w)
+                    stack.append(iter(successors(w)))
+                    break
+            else:
+                colour[path.pop()] = black
+                stack.pop()
+    return []
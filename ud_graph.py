@@ -2,34 +2,327 @@
 # Author: Rachel Thomas
 # Assignment: 6
 # Description:Implement an Undirected Graph class with the following methods; add_vertex(), add_edge()
-# remove_edge(), remove_vertex(), get_vertices(), get_edges(), is_valid_path(), dfs(), bfs(),
-# count_connected_components(), has_cycle()
+# remove_edge(), remove_vertex(), apply_batch(), batch(), get_vertices(), get_edges(), is_valid_path(), dfs(), bfs(),
+# iter_dfs(), iter_bfs(), bfs_many(), count_connected_components(), same_component(), shortest_path(),
+# component_labels(), has_cycle(), find_cycle(), snapshot(), enable_stats(), disable_stats()
 
-import heapq
-from collections import deque
+import os
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections.abc import Mapping, Sequence
 
+import traversal
+from batch import edge_batch
+from graph_io import read_graph, write_graph
+from instrumentation import StatsMixin, instrumented
+from parallel_components import component_roots
+from snapshots import SnapshotMixin, writer
 
-class UndirectedGraph:
+# past this many removed edges waiting to be checked, the component index is rebuilt instead
+_MAX_PENDING_SPLITS = 32
+# component index rebuilds of smaller graphs stay in this process, starting the pool would take longer
+_PARALLEL_MIN_VERTICES = 50000
+
+
+class _Neighbors(dict):
+    """
+    Neighbour ids of a vertex
+    - keeps insertion order, O(1) membership test, insert and delete
+    - view ordered by vertex name, built on first use and then kept sorted by add() and remove().
+      name is the id -> name lookup of the graph
+    """
+
+    __slots__ = ('_sorted',)
+
+    def __init__(self):
+        super().__init__()
+        self._sorted = None
+
+    def add(self, v: int, name) -> None:
+        """
+        Add v as a neighbour
+        """
+        self[v] = None
+        if self._sorted is not None:
+            insort(self._sorted, v, key=name)
+
+    def remove(self, v: int, name) -> None:
+        """
+        Remove neighbour v
+        """
+        del self[v]
+        if self._sorted is not None:
+            del self._sorted[bisect_left(self._sorted, name(v), key=name)]
+
+    def sorted_view(self, name) -> []:
+        """
+        Return neighbours ordered by name. The list is cached, do not modify it
+        """
+        if self._sorted is None:
+            self._sorted = sorted(self, key=name)
+        return self._sorted
+
+    def copy(self) -> '_Neighbors':
+        """
+        Return a copy with its own sorted view
+        """
+        neighbours = _Neighbors.fromkeys(self)
+        if self._sorted is not None:
+            neighbours._sorted = self._sorted[:]
+        return neighbours
+
+
+class _NeighbourNames(Sequence):
+    """
+    Read-only view of the neighbour names of one vertex, in insertion order.
+    A sequence that compares equal to a list of the same names; indexing is O(degree)
+    """
+
+    __slots__ = ('_graph', '_neighbours')
+
+    def __init__(self, graph, neighbours: _Neighbors):
+        self._graph = graph
+        self._neighbours = neighbours
+
+    def __getitem__(self, index):
+        names = self._graph._names
+        selected = list(self._neighbours)[index]
+        if isinstance(index, slice):
+            return [names[v] for v in selected]
+        return names[selected]
+
+    def __iter__(self):
+        names = self._graph._names
+        return (names[v] for v in self._neighbours)
+
+    def __reversed__(self):
+        names = self._graph._names
+        return (names[v] for v in reversed(self._neighbours))
+
+    def __len__(self):
+        return len(self._neighbours)
+
+    def __contains__(self, name):
+        v = self._graph._ids.get(name)
+        return v is not None and v in self._neighbours
+
+    def __eq__(self, other):
+        if isinstance(other, _NeighbourNames):
+            other = list(other)
+        elif not isinstance(other, list):
+            return NotImplemented
+        return list(self) == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class _AdjacencyView(Mapping):
+    """
+    Read-only adjacency list keyed by vertex name, adj_list[v] lists the names of v's neighbours
+    """
+
+    __slots__ = ('_graph',)
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, name) -> _NeighbourNames:
+        return _NeighbourNames(self._graph, self._graph._adj[self._graph._ids[name]])
+
+    def __iter__(self):
+        return iter(self._graph._ids)
+
+    def __len__(self):
+        return len(self._graph._ids)
+
+    def __contains__(self, name):
+        return name in self._graph._ids
+
+
+class _DisjointSet:
+    """
+    Disjoint-set forest over vertex ids, union by size with path halving
+    - count is the number of disjoint sets among the vertices added
+    """
+
+    def __init__(self, capacity=0, count=0):
+        self.parent = list(range(capacity))
+        self.size = [1] * capacity
+        self.count = count
+
+    def copy(self) -> '_DisjointSet':
+        """
+        Return an independent copy of the forest
+        """
+        components = _DisjointSet()
+        components.parent, components.size, components.count = self.parent[:], self.size[:], self.count
+        return components
+
+    def add(self, v: int) -> None:
+        """
+        Add v as a singleton set
+        """
+        if v == len(self.parent):
+            self.parent.append(v)
+            self.size.append(1)
+        else:
+            self.parent[v] = v
+            self.size[v] = 1
+        self.count += 1
+
+    def find(self, v: int) -> int:
+        """
+        Return the representative of the set containing v
+        """
+        parent = self.parent
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    def union(self, u: int, v: int) -> None:
+        """
+        Merge the sets containing u and v
+        """
+        parent = self.parent
+        while parent[u] != u:  # find() inlined, this runs for every added edge
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        if u == v:
+            return
+        if self.size[u] < self.size[v]:
+            u, v = v, u
+        self.parent[v] = u
+        self.size[u] += self.size[v]
+        self.count -= 1
+
+
+class UndirectedGraph(StatsMixin, SnapshotMixin):
     """
     Class to implement undirected graph
     - duplicate edges not allowed
     - loops not allowed
     - no edge weights
     - vertex names are strings
+    - names are interned to dense integer ids (ids of removed vertices are reused) and all
+      algorithms run on ids, names are only translated at the method boundary
+    - adj_list is a read-only view: adj_list[v] lists the neighbours of v in insertion order
+    - connected components are tracked incrementally with a disjoint-set forest
+    - snapshot() returns a read-only copy that shares the neighbour sets with the graph (copy-on-write),
+      mutators hold a lock so a snapshot never sees half of a write
     """
 
     def __init__(self, start_edges=None):
         """
         Store graph info as adjacency list
-        DO NOT CHANGE THIS METHOD IN ANY WAY
         """
-        self.adj_list = dict()
+        self._ids = dict()  # name -> id, in vertex insertion order
+        self._names = []  # id -> name, None for free ids
+        self._adj = []  # id -> _Neighbors, None for free ids
+        self._free = []
+        self._name_of = self._names.__getitem__
+        self._components = _DisjointSet()
+        self._components_stale = True  # the index is built by the first component query
+        self._pending_splits = []  # (u, v) of edges removed since the last component query, may have split one
+        self._version = 0
+        self._stats = None
+        self._shared = bytearray()  # 1 if the neighbour set of id v is shared with a snapshot
+        self._frozen = False
+        self._lock = threading.RLock()
+        self._snapshot = None  # weak reference to the latest snapshot
 
         # populate graph with initial vertices and edges (if provided)
-        # before using, implement add_vertex() and add_edge() methods
         if start_edges is not None:
-            for u, v in start_edges:
-                self.add_edge(u, v)
+            self._load_edges(start_edges)
+
+    @classmethod
+    def from_edges(cls, edges):
+        """
+        Build a graph from an iterable of (u, v) pairs in a single pass, same as UndirectedGraph(edges).
+        Self-loops and repeated edges are dropped
+        """
+        graph = cls()
+        graph._load_edges(edges)
+        return graph
+
+    @classmethod
+    def from_arrays(cls, u, v):
+        """
+        Build a graph from parallel sequences (or NumPy arrays) of edge endpoints
+        """
+        if hasattr(u, 'tolist'):
+            u = u.tolist()
+        if hasattr(v, 'tolist'):
+            v = v.tolist()
+        return cls.from_edges(zip(u, v))
+
+    def _load_edges(self, edges) -> None:
+        """
+        Fill an empty graph from (u, v) pairs, skipping the per-edge checks of add_edge().
+        The component index is rebuilt once, on first use
+        """
+        ids, adj = self._ids, self._adj
+        for u, v in edges:
+            if u == v:
+                continue
+            iu = ids.get(u)
+            if iu is None:
+                iu = self._new_id(u)
+            iv = ids.get(v)
+            if iv is None:
+                iv = self._new_id(v)
+            if iv not in adj[iu]:
+                adj[iu][iv] = None  # sorted views are not built yet
+                adj[iv][iu] = None
+        self._components_stale = True
+        self._version += 1
+
+    def save(self, path) -> None:
+        """
+        Write the graph to path in the binary graph format (see graph_io)
+        """
+        names = list(self._ids)
+        if not all(isinstance(name, str) for name in names):
+            raise TypeError('only graphs with string vertex names can be saved')
+        position = [0] * len(self._names)
+        for index, v in enumerate(self._ids.values()):
+            position[v] = index
+        offsets = array('q', [0])
+        columns = array('q')
+        for v in self._ids.values():
+            columns.extend([position[w] for w in self._adj[v]])
+            offsets.append(len(columns))
+        write_graph(path, b'U', names, offsets, columns, None)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """
+        Read a graph written by save(). With mmap=True the file is memory-mapped and the adjacency is built straight
+        from the mapped pages instead of from a private copy of the file
+        """
+        data = read_graph(path, b'U', use_mmap=mmap)
+        names, offsets, columns = data['names'], data['offsets'], data['columns']
+        graph = cls()
+        graph._names.extend(names)
+        graph._ids.update((name, v) for v, name in enumerate(names))
+        graph._adj.extend(_Neighbors.fromkeys(columns[offsets[v]:offsets[v + 1]]) for v in range(len(names)))
+        graph._components_stale = True
+        graph._version += 1
+        return graph
+
+    @property
+    def adj_list(self) -> _AdjacencyView:
+        """
+        Read-only name-keyed adjacency list
+        """
+        return _AdjacencyView(self)
 
     def __str__(self):
         """
@@ -43,91 +336,264 @@ class UndirectedGraph:
             return f'GRAPH: {{{out}}}'
         return f'GRAPH: {{\n  {out}}}'
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        del state['_name_of']
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._name_of = self._names.__getitem__
+
+    def _fill_snapshot(self, snapshot) -> None:
+        """
+        Snapshots share the neighbour sets, the graph copies a set the first time it modifies it afterwards
+        """
+        snapshot._ids = dict(self._ids)
+        snapshot._names = self._names[:]
+        snapshot._adj = self._adj[:]
+        snapshot._free = self._free[:]
+        snapshot._name_of = snapshot._names.__getitem__
+        snapshot._components = self._components.copy()
+        snapshot._components_stale = self._components_stale
+        snapshot._pending_splits = self._pending_splits[:]
+        snapshot._shared = bytearray()
+        self._shared = bytearray(b'\1') * len(self._adj)
+
     # ------------------------------------------------------------------ #
 
+    def _own_neighbours(self, v: int) -> _Neighbors:
+        """
+        Return the neighbour set of v for writing, copying it first if a snapshot shares it
+        """
+        if v < len(self._shared) and self._shared[v]:
+            self._adj[v] = self._adj[v].copy()
+            self._shared[v] = 0
+        return self._adj[v]
+
+    def _new_id(self, name) -> int:
+        """
+        Intern a new vertex name, reusing the id of a removed vertex when there is one
+        """
+        if self._free:
+            v = self._free.pop()
+            self._names[v] = name
+            self._adj[v] = _Neighbors()
+            if v < len(self._shared):
+                self._shared[v] = 0
+        else:
+            v = len(self._names)
+            self._names.append(name)
+            self._adj.append(_Neighbors())
+        self._ids[name] = v
+        return v
+
+    @writer
     def add_vertex(self, v: str) -> None:
         """
-        Add new vertex to the graph
+        Add new vertex to the graph. Does nothing if the vertex already exists
         """
+        if v in self._ids:
+            return None
+        self._add_vertex(v)
 
-        self.adj_list[v] = []
+    def _add_vertex(self, name) -> int:
+        """
+        Add a vertex that is not in the graph yet and return its id
+        """
+        v = self._new_id(name)
+        if not self._components_stale:
+            self._components.add(v)
+        self._version += 1
+        return v
 
+    @writer
     def add_edge(self, u: str, v: str) -> None:
         """
         Add edge to the graph
         """
-        if u == v:
-            return None
-
-        if u not in self.adj_list and v not in self.adj_list:  # neither in list
-            self.add_vertex(u)
-            self.add_vertex(v)
+        self._add_edges(((u, v),))
 
-        elif u not in self.adj_list:  # just u not in list
-            self.add_vertex(u)
-        elif v not in self.adj_list:  # just v not in list
-            self.add_vertex(v)
+    @writer
+    def add_edges(self, edges) -> None:
+        """
+        Add every (u, v) pair of edges, same as add_edge() calls in that order but taking the lock once
+        """
+        self._add_edges(edges)
 
-        if v in self.adj_list[u]:  # already has an edge
-            return None
-        else:
-            self.adj_list[u].append(v)
+    def _add_edges(self, edges) -> None:
+        """
+        Add (u, v) pairs with the lock held, skipping self-loops and edges already in the graph
+        """
+        ids, adj, name_of = self._ids, self._adj, self._name_of
+        components = None if self._components_stale else self._components  # a stale index is rebuilt anyway
+        version = self._version
+        for u, v in edges:
+            if u == v:
+                continue
+            iu, iv = ids.get(u), ids.get(v)
+            if iu is None or iv is None:
+                if iu is None:
+                    iu = self._new_id(u)
+                    if components is not None:
+                        components.add(iu)
+                if iv is None:
+                    iv = self._new_id(v)
+                    if components is not None:
+                        components.add(iv)
+            elif iv in adj[iu]:  # already has an edge
+                continue
 
-        if u in self.adj_list[v]:
-            return None
-        else:
-            self.adj_list[v].append(u)
+            if self._shared:  # a snapshot has been taken
+                self._own_neighbours(iu)
+                self._own_neighbours(iv)
+            neighbours = adj[iu]
+            neighbours[iv] = None
+            if neighbours._sorted is not None:
+                insort(neighbours._sorted, iv, key=name_of)
+            neighbours = adj[iv]
+            neighbours[iu] = None
+            if neighbours._sorted is not None:
+                insort(neighbours._sorted, iu, key=name_of)
+            if components is not None:
+                components.union(iu, iv)
+            version += 1
+        self._version = version
 
+    @writer
     def remove_edge(self, v: str, u: str) -> None:
         """
         Remove edge from the graph
         """
-        if v not in self.adj_list or u not in self.adj_list:
+        v, u = self._ids.get(v), self._ids.get(u)
+        if v is None or u is None:
             return None
 
-        if u not in self.adj_list[v]:
+        if u not in self._adj[v]:
             return None
 
-        else:
-            self.adj_list[u].remove(v)
-            self.adj_list[v].remove(u)
+        self._own_neighbours(u).remove(v, self._name_of)
+        self._own_neighbours(v).remove(u, self._name_of)
+        if not self._components_stale:
+            # whether the component split is only worked out by the next component query
+            if len(self._pending_splits) < _MAX_PENDING_SPLITS:
+                self._pending_splits.append((u, v))
+            else:
+                self._components_stale = True
+                self._pending_splits = []
+        self._version += 1
 
+    @writer
     def remove_vertex(self, v: str) -> None:
         """
         Remove vertex and all connected edges
         """
-        if v not in self.adj_list:
+        if v not in self._ids:
             return None
 
-        for vertex in self.adj_list[v]:  # things v is connected too
-            self.adj_list[vertex].remove(v)  # remove all edges going to v
-        del self.adj_list[v]
+        v = self._ids.pop(v)
+        for vertex in self._adj[v]:  # things v is connected too
+            self._own_neighbours(vertex).remove(v, self._name_of)  # remove all edges going to v
+        self._adj[v] = None
+        self._names[v] = None
+        self._free.append(v)
+        self._components_stale = True
+        self._version += 1
+
+    def apply_batch(self, adds=(), removes=()) -> None:
+        """
+        Apply many edge changes at once: removes ((u, v) pairs) first, then adds ((u, v) pairs, new vertices are
+        created as by add_edge()). Same as remove_edge()/add_edge() calls in that order, but
+        - every change is validated before anything is modified and the batch raises ValueError for a self-loop or
+          for removing an edge of a vertex that is not in the graph
+        - neighbour sets are updated directly, sorted views and the component index are rebuilt once afterwards
+        A batch that raises leaves the graph unchanged
+        """
+        self._apply_changes([(edge, False) for edge in removes] + [(edge, True) for edge in adds])
+
+    def batch(self):
+        """
+        Context manager collecting edge changes: inside `with g.batch() as batch:` call batch.add_edge(u, v) and
+        batch.remove_edge(u, v), they are applied in call order like apply_batch() when the block ends.
+        If the block raises nothing is applied
+        """
+        return edge_batch(self)
+
+    @writer
+    def _apply_changes(self, changes: []) -> None:
+        """
+        Validate and apply (edge, add) pairs in order, see apply_batch()
+        """
+        ids = self._ids
+        new_names = {}  # vertices the batch creates, in order of first appearance
+        for edge, add in changes:
+            if len(edge) != 2:
+                raise ValueError(f'bad edge {edge!r}, expected (u, v)')
+            u, v = edge
+            if u == v:
+                raise ValueError(f'edge {edge!r} is a loop')
+            if u not in ids or v not in ids:
+                if not add and (u not in ids and u not in new_names or v not in ids and v not in new_names):
+                    raise ValueError(f'edge {edge!r} has a vertex that is not in the graph')
+                new_names.update((name, None) for name in edge if name not in ids)
+
+        for name in new_names:
+            v = self._new_id(name)
+            if not self._components_stale:
+                self._components.add(v)
+        adj = self._adj
+        components = None if self._components_stale else self._components
+        touched = set()
+        removed = False
+        for (u, v), add in changes:  # in call order, so neighbour order matches the same add_edge() calls
+            u, v = ids[u], ids[v]
+            if (v in adj[u]) == add:
+                continue
+            if self._shared:  # a snapshot has been taken
+                self._own_neighbours(u)
+                self._own_neighbours(v)
+            if add:
+                adj[u][v] = None
+                adj[v][u] = None
+                if components is not None:
+                    components.union(u, v)
+            else:
+                del adj[u][v]
+                del adj[v][u]
+                removed = True
+            touched.add(u)
+            touched.add(v)
+        if removed:
+            self._components_stale = True  # rebuild once on the next component query
+        for v in touched:
+            adj[v]._sorted = None
+        if new_names or touched:
+            self._version += 1
 
     def get_vertices(self) -> []:
         """
         Return list of vertices in the graph (any order)
         """
-        vertex_list = []
-        if len(self.adj_list) == 0:
-            return vertex_list
-        else:
-            for key in self.adj_list:
-                vertex_list.append(key)
-        return vertex_list
+        return list(self._ids)
 
     def get_edges(self) -> []:
         """
         Return list of edges in the graph (any order)
         """
-        edge_list = []
-        if len(self.adj_list) == 0:
-            return edge_list
+        return list(self.iter_edges())
 
-        for key in self.adj_list:
-            for value in self.adj_list[key]:
-                if (key, value) and (value, key) not in edge_list:
-                    edge_list.append((key, value))
-        return edge_list
+    def iter_edges(self):
+        """
+        Yield each edge of the graph exactly once, in O(V + E)
+        Edge (u, v) is reported from whichever endpoint comes first in the vertex order
+        """
+        names = self._names
+        done = bytearray(len(names))
+        for name, v in self._ids.items():
+            for w in self._adj[v]:
+                if not done[w]:
+                    yield name, names[w]
+            done[v] = 1
 
     def is_valid_path(self, path: []) -> bool:
         """
@@ -136,126 +602,274 @@ class UndirectedGraph:
         if len(path) == 0:
             return True
 
-        if len(path) == 1:
-            if path[0] in self.get_vertices():
-                return True
-            else:
+        ids = [self._ids.get(v) for v in path]
+        if None in ids:
+            return False
+        for index in range(len(ids) - 1):
+            if ids[index + 1] not in self._adj[ids[index]]:
                 return False
-
-        for index in range(len(path)):
-            if index + 1 <= len(path) - 1:
-                item = path[index]
-                next = path[index + 1]
-                if item not in self.adj_list:
-                    return False
-                elif next not in self.adj_list[item]:
-                    return False
         return True
 
+    def _sorted_neighbours(self, v: int) -> []:
+        """
+        Return neighbour ids of v in alphabetical order of their names
+        """
+        return self._adj[v].sorted_view(self._name_of)
+
+    @instrumented
     def dfs(self, v_start, v_end=None) -> []:
         """
         Return list of vertices visited during DFS search
         Vertices are picked in alphabetical order
         """
         reachable = []
-        stack = []
-
-        if v_start not in self.get_vertices():
-            return reachable
-        else:
-            stack.append(v_start)
-
-        while len(stack) > 0:
-            v = stack.pop()
-            successors = sorted(self.adj_list[v], reverse=True)
-            if v not in reachable:
-                reachable.append(v)
-                if v == v_end:
-                    return reachable
-                for item in successors:
-                    stack.append(item)
+        for v in self.iter_dfs(v_start):
+            reachable.append(v)
+            if v == v_end:
+                break
         return reachable
 
-    def bfs(self, v_start, v_end=None) -> []:
+    @instrumented
+    def bfs(self, v_start, v_end=None, max_depth=None) -> []:
         """
         Return list of vertices visited during BFS search
-        Vertices are picked in alphabetical order
+        Vertices are picked in alphabetical order, vertices further than max_depth edges are not visited
         """
-
         reachable = []
-        q = deque()
+        for v in self.iter_bfs(v_start, max_depth):
+            reachable.append(v)
+            if v == v_end:
+                break
+        return reachable
 
-        if v_start not in self.get_vertices():
-            return reachable
-        else:
-            q.append(v_start)
-
-        while len(q) > 0:
-            v = q.popleft()
-            successors = sorted(self.adj_list[v])
-            if v not in reachable:
-                reachable.append(v)
-                if v == v_end:
-                    return reachable
-                for item in successors:
-                    if item not in reachable:
-                        q.append(item)
+    def iter_dfs(self, v_start):
+        """
+        Yield vertices in the order dfs() visits them. The search only advances as vertices are consumed
+        """
+        if v_start not in self._ids:
+            return
+        names = self._names
+        for v in traversal.iter_dfs(self._ids[v_start], self._sorted_neighbours, bytearray(len(names)),
+                                    self._probe()):
+            yield names[v]
 
-        return reachable
+    def iter_bfs(self, v_start, max_depth=None, with_depth=False):
+        """
+        Yield vertices in the order bfs() visits them, or (vertex, depth) pairs with with_depth=True.
+        Stops after depth max_depth (if given). The search only advances as vertices are consumed
+        """
+        if v_start not in self._ids:
+            return
+        names = self._names
+        for v, depth in traversal.iter_bfs(self._ids[v_start], self._sorted_neighbours, bytearray(len(names)),
+                                           max_depth, self._probe()):
+            yield (names[v], depth) if with_depth else names[v]
 
-    def count_connected_components(self):
+    @instrumented
+    def bfs_many(self, sources) -> ():
         """
-        Return number of connected components in the graph
+        Run BFS from every vertex in sources together, expanding one shared frontier per level.
+        Return (reachable, depth), row i belongs to sources[i] and columns follow the order of get_vertices():
+        depth[i][j] is the number of edges between sources[i] and vertex j, -1 if they are not connected (or
+        sources[i] is not a vertex), and reachable[i][j] is depth[i][j] >= 0.
+        With NumPy these are bool and int32 arrays, otherwise lists of bytearray and array('i')
         """
-        count = 0
-        visited = []
+        sources = [self._ids.get(v) for v in sources]
+        offsets, targets = self._csr_arrays()
+        columns = list(self._ids.values())
+        if columns == list(range(len(self._names))):
+            columns = None  # ids are already in vertex order
+        return traversal.bfs_many(sources, offsets, targets, columns)
 
-        for vertex in self.get_vertices():
-            if vertex not in visited:
-                reachable = self.dfs(vertex)
-                count += 1
-                for vertex in reachable:
-                    if vertex not in visited:
-                        visited.append(vertex)
-        return count
+    def _csr_arrays(self) -> ():
+        """
+        Return the adjacency as compressed sparse rows (offsets, targets) of array('q'): the neighbour ids of id v
+        are targets[offsets[v]:offsets[v + 1]], free ids have none
+        """
+        offsets = array('q', [0])
+        targets = array('q')
+        for neighbours in self._adj:
+            if neighbours is not None:
+                targets.extend(neighbours)
+            offsets.append(len(targets))
+        return offsets, targets
 
-    def has_cycle(self):
+    def _still_connected(self, u: int, v: int) -> bool:
         """
-        Return True if graph contains a cycle, False otherwise
+        Return True if u and v are connected, searching from both ends in turn.
+        Stops as soon as the searches meet or either side runs out, so a split costs
+        O(size of the smaller side)
         """
-        stack = []
-        visited = []
-        flags = {}
+        seen_u, seen_v = {u}, {v}
+        frontier_u, frontier_v = [u], [v]
+        while frontier_u and frontier_v:
+            if len(seen_u) > len(seen_v):
+                seen_u, seen_v = seen_v, seen_u
+                frontier_u, frontier_v = frontier_v, frontier_u
+            x = frontier_u.pop()
+            for y in self._adj[x]:
+                if y in seen_v:
+                    return True
+                if y not in seen_u:
+                    seen_u.add(y)
+                    frontier_u.append(y)
+        return False
 
-        for vertex in self.get_vertices():
-            flags[vertex] = -1
+    def _connected_components(self, processes=1) -> _DisjointSet:
+        """
+        Return the component index, rebuilding it after a vertex removal or component split.
+        With processes > 1 (None for the CPU count) large graphs are rebuilt in parallel
+        """
+        if not self._pending_splits and not self._components_stale:
+            return self._components
+        # readers of a shared snapshot resolve the index one at a time, and pending splits are only cleared once
+        # they are resolved, so no reader can answer from an index another reader is still checking
+        with self._lock:
+            if self._pending_splits:
+                if not self._components_stale and not all(self._still_connected(u, v)
+                                                          for u, v in self._pending_splits):
+                    self._components_stale = True
+                self._pending_splits = []
+            if self._components_stale:
+                if processes is None:
+                    processes = os.cpu_count() or 1
+                if processes > 1 and len(self._ids) >= _PARALLEL_MIN_VERTICES:
+                    components = self._parallel_components(processes)
+                else:
+                    components = _DisjointSet(len(self._names), len(self._ids))
+                    for v in self._ids.values():
+                        for w in self._adj[v]:
+                            if v < w:
+                                components.union(v, w)
+                self._components = components
+                self._components_stale = False
+                probe = self._probe()
+                if probe is not None:
+                    probe.vertices_popped += len(self._ids)
+                    probe.edges_relaxed += sum(len(self._adj[v]) for v in self._ids.values())
+            return self._components
 
-        vertex_list = self.get_vertices()
-        if len(vertex_list) > 0:
-            v = vertex_list[0]
-            stack.append(v)
-            flags[v] = 0
-        else:
+    def _parallel_components(self, processes: int) -> _DisjointSet:
+        """
+        Build the component index with union-find over vertex ranges in a pool of processes,
+        which read the adjacency from shared memory
+        """
+        offsets, targets = self._csr_arrays()
+        roots = component_roots(offsets, targets, processes)
+        components = _DisjointSet()
+        components.parent = roots
+        components.size = [0] * len(roots)
+        for v in self._ids.values():
+            components.size[roots[v]] += 1
+        components.count = sum(1 for v in self._ids.values() if roots[v] == v)
+        for v in self._free:
+            components.size[v] = 1
+        return components
+
+    @instrumented
+    def count_connected_components(self, processes=1):
+        """
+        Return number of connected components in the graph
+        - processes > 1 (None for the CPU count) rebuilds an out of date component index of a large graph in a pool
+          of processes
+        """
+        return self._connected_components(processes).count
+
+    @instrumented
+    def component_labels(self, processes=1) -> {}:
+        """
+        Return {vertex: label} where vertices share a label exactly when they are connected. Components are
+        numbered 0, 1, ... in the order their first vertex appears in get_vertices()
+        - processes > 1 (None for the CPU count) rebuilds an out of date component index of a large graph in a pool
+          of processes, the labels are the same as with processes=1
+        """
+        components = self._connected_components(processes)
+        find = components.find
+        numbers = {}
+        return {name: numbers.setdefault(find(v), len(numbers)) for name, v in self._ids.items()}
+
+    @instrumented
+    def same_component(self, u: str, v: str) -> bool:
+        """
+        Return True if u and v are vertices of the same connected component
+        """
+        u, v = self._ids.get(u), self._ids.get(v)
+        if u is None or v is None:
             return False
-        for v in vertex_list:
-            stack.append(v)
-            flags[v] = 0
-            while len(stack) > 0:
-                v = stack.pop()
-                successors = sorted(self.adj_list[v], reverse=True)
-                if v not in visited:
-                    visited.append(v)
-                    flags[v]= 1
-                    if len(successors)>0:
-                        for item in successors:
-                            if flags[item] ==0:
-                                return True
-                            stack.append(item)
-                            if flags[item] == -1:
-                                flags[item]=0
+        components = self._connected_components()
+        return components.find(u) == components.find(v)
 
-        return False
+    @instrumented
+    def shortest_path(self, u: str, v: str) -> ():
+        """
+        Return (path, length) of a shortest path from u to v, length counted in edges, ([], inf) if v cannot be
+        reached. While the component index is up to date, vertices in different components are answered from it
+        without searching. Otherwise a bidirectional BFS expands one whole level of the smaller frontier at a time
+        and stops when either side runs out (the index is never rebuilt for a single pair)
+        """
+        u, v = self._ids.get(u), self._ids.get(v)
+        if u is None or v is None:
+            return [], float('inf')
+        if u == v:
+            return [self._names[u]], 0
+        # pending splits can only make the index report too few components, so different roots are still final
+        components = self._components
+        if not self._components_stale and components.find(u) != components.find(v):
+            return [], float('inf')
+
+        adj = self._adj
+        probe = self._probe()
+        parents = ({u: None}, {v: None})
+        frontiers = ([u], [v])
+        meet = None
+        while meet is None:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            if not frontiers[side]:
+                return [], float('inf')
+            near, far = parents[side], parents[1 - side]
+            next_frontier = []
+            for x in frontiers[side]:
+                for y in adj[x]:
+                    if y not in near:
+                        near[y] = x
+                        if y in far:
+                            meet = y
+                            break
+                        next_frontier.append(y)
+                if meet is not None:
+                    break
+            if probe is not None:  # counted per level, the last one as if fully expanded
+                probe.vertices_popped += len(frontiers[side])
+                probe.edges_relaxed += sum(len(adj[x]) for x in frontiers[side])
+                probe.frontier(len(next_frontier))
+            frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+
+        path = [meet]
+        while parents[0][path[-1]] is not None:
+            path.append(parents[0][path[-1]])
+        path.reverse()
+        x = parents[1][meet]
+        while x is not None:
+            path.append(x)
+            x = parents[1][x]
+        return [self._names[x] for x in path], len(path) - 1
+
+    @instrumented
+    def has_cycle(self):
+        """
+        Return True if graph contains a cycle, False otherwise
+        """
+        return len(self.find_cycle()) > 0
 
+    @instrumented
+    def find_cycle(self) -> []:
+        """
+        Return the vertices of a cycle in path order (the last vertex is adjacent to the first),
+        empty list if the graph has no cycle
+        """
+        cycle = traversal.find_cycle(list(self._ids.values()), self._adj.__getitem__, bytearray(len(self._names)),
+                                     undirected=True, probe=self._probe())
+        return [self._names[v] for v in cycle]
 
 
 if __name__ == '__main__':
@@ -343,3 +957,72 @@ if __name__ == '__main__':
         u, v = edge
         g.add_edge(u, v) if command == 'add' else g.remove_edge(u, v)
         print('{:<10}'.format(case), g.has_cycle())
+
+    print("\nmethod snapshot() example 1")
+    print("---------------------------")
+    g = UndirectedGraph(['AB', 'AC', 'BC', 'BD', 'CD', 'CE', 'DE'])
+    snapshot = g.snapshot()
+    edges = snapshot.get_edges()
+
+    def churn():
+        for _ in range(1000):
+            g.remove_edge('C', 'E')
+            g.remove_vertex('D')
+            g.add_edge('D', 'E')
+            g.add_edge('C', 'E')
+            g.add_edge('B', 'D')
+            g.add_edge('C', 'D')
+
+    writer_thread = threading.Thread(target=churn)
+    writer_thread.start()
+    unchanged = all(snapshot.get_edges() == edges and snapshot.count_connected_components() == 1
+                    for _ in range(1000))
+    writer_thread.join()
+    g.remove_vertex('E')
+    print(snapshot.get_edges(), snapshot.dfs('A'), unchanged, sep='\n')
+    print(g.get_edges(), g.dfs('A'), sep='\n')
+    try:
+        snapshot.add_edge('A', 'E')
+    except TypeError as error:
+        print(error)
+
+    print("\nmethod snapshot() example 2")
+    print("---------------------------")
+    # readers sharing a snapshot that still has removed edges to check must all see the split
+    import sys
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often, so the readers really overlap
+    ring = [(str(v), str((v + 1) % 2000)) for v in range(2000)] + [('X', 'Y')]
+    counts = set()
+    for _ in range(100):
+        g = UndirectedGraph(ring)
+        g.count_connected_components()
+        g.remove_edge('0', '1')  # no split, but checking it walks the whole ring
+        g.remove_edge('1000', '1001')  # splits the ring
+        snapshot = g.snapshot()
+        barrier = threading.Barrier(4)
+
+        def read():
+            barrier.wait()
+            counts.add(snapshot.count_connected_components())
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+    sys.setswitchinterval(interval)
+    print(sorted(counts))
+
+    print("\nmethod component_labels() example 1")
+    print("-----------------------------------")
+    # large enough for processes > 1 to rebuild the component index in a process pool
+    size = max(_PARALLEL_MIN_VERTICES, 60000)
+    edges = [(str(v), str(v + 1)) for v in range(size - 1) if v % 7]
+    edges += [(str(v), str(v * 31 % size)) for v in range(0, size, 97)]
+    serial, parallel = UndirectedGraph(edges), UndirectedGraph(edges)
+    for g in serial, parallel:
+        g.remove_vertex('7')  # leaves the component index out of date
+    labels = serial.component_labels()
+    print(len(set(labels.values())), parallel.count_connected_components(processes=2))
+    print(labels == parallel.component_labels(processes=2))